@@ -0,0 +1,250 @@
+"""Offline benchmarks for the linkedin_feed ingest and query hot paths.
+
+Generates a synthetic feed, grows a temporary database through several
+sizes and measures throughput and peak Python memory of each hot path.
+Results are appended as one JSON line per run so runs can be compared.
+
+    python bench_linkedin_feed.py --sizes 1000 10000 50000 --output bench_results.jsonl
+"""
+
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import linkedin_feed
+
+DEFAULT_SIZES = (1000, 10000, 50000)
+DEFAULT_OUTPUT = "bench_results.jsonl"
+FETCH_BATCH = 200
+MARK_BATCH = 1000
+PARSE_COUNT = 100000
+
+# Relative ages as LinkedIn shows them, weighted towards recent posts.
+OLD_STRINGS = (
+    ["Just now"] + [f"{m}m" for m in (1, 5, 14, 30, 45)] * 2
+    + [f"{h}h" for h in range(1, 24)] * 3
+    + [f"{h}h • Edited" for h in (2, 5, 9)]
+    + [f"{d}d" for d in range(1, 7)] * 2
+    + [f"{w}w" for w in (1, 2, 3)]
+    + ["1mo", "2 mo", "1yr", "5h • Edited • 2nd", "None"]
+)
+WORDS = (
+    "rails ruby ai agents llm claude code hiring startup founder team product "
+    "learning mentorship kamal hotwire turbo sidekiq deploy scaling lessons "
+    "the a and of to in is for with on we our this that it you your"
+).split()
+
+
+def generate_old_strings(count, seed=0):
+    """Return count relative ages drawn from OLD_STRINGS with one seeded RNG."""
+    rng = random.Random(seed)
+    return [rng.choice(OLD_STRINGS) for _ in range(count)]
+
+
+def generate_feed(count, duplicate_rate=0.1, seed=0, start=0):
+    """Return count synthetic feed posts shaped like get_feed_posts output.
+
+    Content lengths follow a log-normal curve (median ~500 characters,
+    capped at 3000). duplicate_rate of the posts repeat the content of an
+    earlier post, as reshares do. Ids start at start so successive calls
+    produce new URLs.
+    """
+    rng = random.Random(seed + start)
+    posts = []
+    for i in range(start, start + count):
+        if posts and rng.random() < duplicate_rate:
+            content = rng.choice(posts)["content"]
+        else:
+            length = min(3000, int(rng.lognormvariate(6.2, 0.8)))
+            words = []
+            while sum(len(w) + 1 for w in words) < length:
+                words.append(rng.choice(WORDS))
+            content = " ".join(words)
+        posts.append({
+            "url": f"https://www.linkedin.com/feed/update/urn:li:activity:{7000000000 + i}",
+            "author_name": f"Author {rng.randrange(2000)}",
+            "author_profile": f"https://www.linkedin.com/in/author-{rng.randrange(2000)}",
+            "content": content,
+            "old": rng.choice(OLD_STRINGS),
+        })
+    return posts
+
+
+def fake_feed(posts, latency=0.0):
+    """Return a get_feed_posts stand-in serving posts, sleeping latency per call."""
+    def get_feed_posts(limit, offset, exclude_promoted_posts=True):
+        if latency:
+            time.sleep(latency)
+        return posts[offset:offset + limit]
+
+    return get_feed_posts
+
+
+def measure(name, run, make_args=lambda: (), items=1, db_size=None):
+    """Time run(*make_args()) and, in a second call, trace its peak memory.
+
+    make_args is called before each run so mutating benchmarks get fresh
+    input for the memory pass. Returns one result dict.
+    """
+    args = make_args()
+    started = time.perf_counter()
+    run(*args)
+    seconds = time.perf_counter() - started
+
+    args = make_args()
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": name,
+        "db_size": db_size,
+        "items": items,
+        "seconds": round(seconds, 6),
+        "items_per_sec": round(items / seconds, 1) if seconds else None,
+        "peak_bytes": peak,
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, latency=0.05, duplicate_rate=0.1, seed=0,
+                   parse_count=PARSE_COUNT):
+    """Run every benchmark against a fresh temporary database; return results."""
+    results = []
+    fetched_at = datetime.now(timezone.utc)
+    olds = generate_old_strings(parse_count, seed=seed)
+    results.append(measure(
+        "estimate_posted_at",
+        lambda olds: [linkedin_feed.estimate_posted_at(o, fetched_at) for o in olds],
+        lambda: (olds,),
+        items=parse_count,
+    ))
+    results.append(measure(
+        "estimate_posted_at_batch",
+        lambda olds: linkedin_feed.estimate_posted_at_batch(olds, fetched_at),
+        lambda: (olds,),
+        items=parse_count,
+    ))
+
+    feed = generate_feed(400, duplicate_rate=duplicate_rate, seed=seed)
+    for concurrency in (1, 4):
+        results.append(measure(
+            f"fetch_feed_batched_c{concurrency}",
+            lambda: linkedin_feed.fetch_feed_batched(
+                fake_feed(feed, latency), limit=400, concurrency=concurrency),
+            items=400,
+        ))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        linkedin_feed.init_db(db)
+        next_id = [0]
+
+        def fresh_posts(count):
+            posts = generate_feed(count, duplicate_rate=duplicate_rate, seed=seed,
+                                  start=next_id[0])
+            next_id[0] += count
+            return posts
+
+        for size in sorted(sizes):
+            grow = size - next_id[0]
+            if grow > 0:
+                results.append(measure(
+                    "store_posts_bulk", lambda p: linkedin_feed.store_posts(db, p),
+                    lambda: (fresh_posts(grow // 2),), items=grow // 2, db_size=size,
+                ))
+                linkedin_feed.store_posts(db, fresh_posts(size - next_id[0]))
+
+            def fetch_batch():
+                # a fetch-sized batch where about a third are already stored
+                batch = fresh_posts(FETCH_BATCH)
+                known = generate_feed(FETCH_BATCH // 3, seed=seed, start=next_id[0] - size // 2)
+                return (batch + known,)
+
+            results.append(measure(
+                "store_posts_fetch", lambda p: linkedin_feed.store_posts(db, p),
+                fetch_batch, items=FETCH_BATCH, db_size=size,
+            ))
+
+            count = linkedin_feed.count_unprocessed(db)
+            results.append(measure(
+                "get_unprocessed", lambda: linkedin_feed.get_unprocessed(db),
+                items=count, db_size=size,
+            ))
+
+            after = fetched_at - timedelta(days=7)
+            week = sum(1 for _ in linkedin_feed.iter_posts(db, after=after))
+            results.append(measure(
+                "get_posts_last_week", lambda: linkedin_feed.get_posts(db, after=after),
+                items=week, db_size=size,
+            ))
+
+            def unprocessed_urls():
+                conn = sqlite3.connect(db)
+                urls = [row[0] for row in conn.execute(
+                    "SELECT url FROM posts WHERE processed = 0 ORDER BY rowid LIMIT ?",
+                    (MARK_BATCH,))]
+                conn.close()
+                return (urls,)
+
+            results.append(measure(
+                "mark_processed", lambda urls: linkedin_feed.mark_processed(db, urls),
+                unprocessed_urls, items=MARK_BATCH, db_size=size,
+            ))
+
+    return results
+
+
+def write_results(results, output=DEFAULT_OUTPUT):
+    """Append one run (metadata plus results) as a JSON line to output."""
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "results": results,
+    }
+    with open(output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark linkedin_feed hot paths offline")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+        help="Database sizes (posts) to measure at",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05,
+        help="Simulated API latency per batch, in seconds (default: 0.05)",
+    )
+    parser.add_argument(
+        "--duplicate-rate", type=float, default=0.1,
+        help="Fraction of synthetic posts that reshare earlier content (default: 0.1)",
+    )
+    parser.add_argument(
+        "--output", default=DEFAULT_OUTPUT,
+        help=f"JSON lines file to append results to (default: {DEFAULT_OUTPUT})",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, latency=args.latency, duplicate_rate=args.duplicate_rate)
+    write_results(results, args.output)
+
+    print(f"{'benchmark':<26}{'db size':>10}{'items':>9}{'seconds':>11}{'items/s':>12}{'peak KiB':>11}")
+    for r in results:
+        db_size = r["db_size"] if r["db_size"] is not None else "-"
+        print(f"{r['name']:<26}{db_size:>10}{r['items']:>9}{r['seconds']:>11.4f}"
+              f"{r['items_per_sec'] or 0:>12.0f}{r['peak_bytes'] // 1024:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,91 @@
 """Fetch LinkedIn feed posts and store them in a local SQLite database."""
 
+import base64
+import gzip
+import hashlib
 import json
 import os
+import random
 import re
+import shutil
 import sqlite3
 import sys
+import threading
 import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-
-from linkedin_api import Linkedin
-from requests.cookies import RequestsCookieJar
+from functools import lru_cache
 
 DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "linkedin_feed.db")
+DEFAULT_ANGLES_PATH = os.path.join(os.path.dirname(__file__), "angles.json")
 BATCH_SIZE = 50
 DEFAULT_LIMIT = 200
 
 
+_AGE_RE = re.compile(r"(\d+)\s*([^\W\d_]+)")
+_LEGACY_UNIT_RE = re.compile(r"mo|min|mi|yr|hr|s|m|h|d|w")
+_SECOND = timedelta(seconds=1)
+_MINUTE = timedelta(minutes=1)
+_HOUR = timedelta(hours=1)
+_DAY = timedelta(days=1)
+_WEEK = timedelta(weeks=1)
+_MONTH = timedelta(days=30)
+_YEAR = timedelta(days=365)
+# Unit words LinkedIn shows, in English, German, Spanish and French.
+AGE_UNITS = {
+    **dict.fromkeys(["s", "sec", "secs", "second", "seconds", "sek", "sekunde", "sekunden",
+                     "seg", "segundo", "segundos", "seconde", "secondes"], _SECOND),
+    **dict.fromkeys(["m", "mi", "min", "mins", "minute", "minutes", "minuten",
+                     "minuto", "minutos"], _MINUTE),
+    **dict.fromkeys(["h", "hr", "hrs", "hour", "hours", "std", "stunde", "stunden",
+                     "hora", "horas", "heure", "heures"], _HOUR),
+    **dict.fromkeys(["d", "day", "days", "t", "tag", "tage", "tagen",
+                     "día", "días", "dia", "dias", "j", "jour", "jours"], _DAY),
+    **dict.fromkeys(["w", "wk", "wks", "week", "weeks", "wo", "woche", "wochen",
+                     "sem", "semana", "semanas", "semaine", "semaines"], _WEEK),
+    **dict.fromkeys(["mo", "mos", "month", "months", "mon", "monat", "monate", "monaten",
+                     "mes", "meses", "mois"], _MONTH),
+    **dict.fromkeys(["y", "yr", "yrs", "year", "years", "jahr", "jahre", "jahren",
+                     "a", "año", "años", "an", "ans"], _YEAR),
+}
+_NOW_WORDS = ("now", "just", "gerade", "ahora", "instant")
+_EDITED_WORDS = {"edited", "bearbeitet", "editado", "modifié"}
+AGE_CACHE_SIZE = 1024
+
+
+def _time_part(old_text):
+    """Normalize an age string to its lowercased time part.
+
+    Takes the first "•"-separated part that isn't an "Edited" marker, so
+    both "5h • Edited" and "Edited • 5h" give "5h".
+    """
+    parts = [part.strip().lower() for part in old_text.split("•")]
+    return next((p for p in parts if p not in _EDITED_WORDS), parts[0])
+
+
+@lru_cache(maxsize=AGE_CACHE_SIZE)
+def _parse_age(time_part):
+    """Age of a post from a normalized time part, or None if unparseable.
+
+    Unit words are looked up in AGE_UNITS; unknown words fall back to
+    the original prefix match ("3 hours" -> h).
+    """
+    match = _AGE_RE.match(time_part)
+    if not match:
+        if any(word in time_part for word in _NOW_WORDS):
+            return timedelta(0)
+        return None
+
+    step = AGE_UNITS.get(match.group(2))
+    if step is None:
+        legacy = _LEGACY_UNIT_RE.match(match.group(2))
+        if not legacy:
+            return None
+        step = AGE_UNITS[legacy.group(0)]
+    return int(match.group(1)) * step
+
+
 def estimate_posted_at(old_text, fetched_at):
     """Convert a relative age string like '2h' into an absolute datetime.
 
@@ -23,41 +93,217 @@ def estimate_posted_at(old_text, fetched_at):
     """
     if not old_text or old_text == "None":
         return None
+    age = _parse_age(_time_part(old_text))
+    return fetched_at - age if age is not None else None
 
-    time_part = old_text.split("•")[0].strip()
 
-    match = re.match(r"(\d+)\s*(mo|min|mi|yr|hr|s|m|h|d|w)", time_part, re.IGNORECASE)
-    if not match:
-        if "now" in time_part.lower() or "just" in time_part.lower():
-            return fetched_at
+def estimate_posted_at_batch(old_texts, fetched_at):
+    """estimate_posted_at for many age strings sharing one fetched_at.
+
+    Repeated strings ("1h", "2d", ...) are parsed once per batch.
+    """
+    results = {}
+    out = []
+    for old_text in old_texts:
+        if old_text not in results:
+            results[old_text] = estimate_posted_at(old_text, fetched_at)
+        out.append(results[old_text])
+    return out
+
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SIMHASH_MAX_DISTANCE = 3
+_SIMHASH_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+# Translation tables mapping a byte to 1 if bit k is set, else 0.
+_BYTE_BIT = [bytes(value >> k & 1 for value in range(256)) for k in range(8)]
+_WORD_RE = re.compile(r"\w+")
+
+
+def simhash(text):
+    """64-bit SimHash of text over word 3-shingles, or None for empty text.
+
+    Shingle hashes are packed into one bytes object and each bit column
+    is counted with bytes.translate/count, so the per-bit tally runs in
+    C instead of a Python loop per shingle. The result is returned
+    signed so it fits an SQLite INTEGER.
+    """
+    words = _WORD_RE.findall((text or "").lower())
+    if not words:
         return None
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+    digests = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles
+    )
+    half = len(shingles) / 2
+    value = 0
+    for byte in range(8):
+        column = digests[byte::8]
+        for k in range(8):
+            if column.translate(_BYTE_BIT[k]).count(1) > half:
+                value |= 1 << (byte * 8 + k)
+    return value - (1 << SIMHASH_BITS) if value >> (SIMHASH_BITS - 1) else value
+
+
+def simhash_bands(value):
+    """Split a SimHash into SIMHASH_BANDS band keys for LSH lookups.
+
+    Two hashes within SIMHASH_MAX_DISTANCE bits share at least one band.
+    Keys carry the band number in the high bits so one index serves all.
+    """
+    unsigned = value & ((1 << SIMHASH_BITS) - 1)
+    band_mask = (1 << _SIMHASH_BAND_BITS) - 1
+    return [
+        (band << _SIMHASH_BAND_BITS) | (unsigned >> (band * _SIMHASH_BAND_BITS)) & band_mask
+        for band in range(SIMHASH_BANDS)
+    ]
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two 64-bit hashes."""
+    return bin((a ^ b) & ((1 << SIMHASH_BITS) - 1)).count("1")
+
+
+def load_scorer(path=DEFAULT_ANGLES_PATH):
+    """Build a keyword scorer from an angles file (see angles.json).
 
-    value = int(match.group(1))
-    unit = match.group(2).lower()
-
-    if unit == "s":
-        delta = timedelta(seconds=value)
-    elif unit in ("m", "mi", "min"):
-        delta = timedelta(minutes=value)
-    elif unit in ("h", "hr"):
-        delta = timedelta(hours=value)
-    elif unit == "d":
-        delta = timedelta(days=value)
-    elif unit == "w":
-        delta = timedelta(weeks=value)
-    elif unit == "mo":
-        delta = timedelta(days=value * 30)
-    elif unit == "yr":
-        delta = timedelta(days=value * 365)
+    All keywords of all angles go into one case-insensitive alternation,
+    so scoring a post is a single regex pass. The version is a hash of
+    the file's contents and tags cached scores.
+    """
+    with open(path, encoding="utf-8") as f:
+        raw = f.read()
+    config = json.loads(raw)
+    keywords = {}
+    for angle, spec in config["angles"].items():
+        for keyword, weight in spec["keywords"].items():
+            keywords.setdefault(keyword.lower(), []).append((angle, spec["weight"] * weight))
+    alternation = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return {
+        "pattern": re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", re.IGNORECASE),
+        "keywords": keywords,
+        "bonus": config.get("multi_angle_bonus", 0),
+        "version": hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12],
+    }
+
+
+def score_text(scorer, text):
+    """Score text against the scorer's angles.
+
+    Each distinct keyword found adds its weighted value to its angles;
+    every matched angle beyond the first adds the multi-angle bonus.
+    """
+    found = {match.lower() for match in scorer["pattern"].findall(text or "")}
+    angles = {}
+    for keyword in found:
+        for angle, value in scorer["keywords"][keyword]:
+            angles[angle] = angles.get(angle, 0) + value
+    score = sum(angles.values())
+    if len(angles) > 1:
+        score += scorer["bonus"] * (len(angles) - 1)
+    return round(score, 3)
+
+
+SCORE_BATCH = 1000
+
+
+def score_posts(db_path=DEFAULT_DB_PATH, scorer=None, conn=None):
+    """Score unprocessed posts that lack a score for this scorer version.
+
+    Scores are cached in posts.score with posts.score_version, so only
+    new posts (or all of them, after the angles file changes) are scored.
+    Returns the number of posts scored.
+    """
+    scorer = scorer or load_scorer()
+    scored = 0
+    last_rowid = 0
+    with _connection(db_path, conn) as conn:
+        while True:
+            batch = conn.execute(
+                "SELECT rowid, content FROM posts "
+                "WHERE processed = 0 AND score_version IS NOT ? AND rowid > ? "
+                "ORDER BY rowid LIMIT ?",
+                (scorer["version"], last_rowid, SCORE_BATCH),
+            ).fetchall()
+            if not batch:
+                return scored
+            conn.executemany(
+                "UPDATE posts SET score = ?, score_version = ? WHERE rowid = ?",
+                [(score_text(scorer, content), scorer["version"], rowid)
+                 for rowid, content in batch],
+            )
+            scored += len(batch)
+            last_rowid = batch[-1][0]
+
+
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16384
+
+
+def connect(db_path=DEFAULT_DB_PATH):
+    """Open a connection with the store's pragmas applied.
+
+    WAL lets readers run alongside the writer, and synchronous=NORMAL
+    skips the fsync on every commit (safe in WAL mode).
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    return conn
+
+
+@contextmanager
+def session(db_path=DEFAULT_DB_PATH):
+    """Yield one connection for a unit of work, committed as one transaction.
+
+    Pass the connection as conn= to the store functions to share it.
+    Rolls back if the block raises. Two functions commit the shared
+    connection themselves: record_fetch (after storing a fetch, then
+    after logging its commit time) and export_posts (before it writes
+    the manifest).
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def _connection(db_path, conn=None):
+    """Use the caller's connection as-is, or open a session of our own."""
+    if conn is not None:
+        yield conn
     else:
-        return None
+        with session(db_path) as own:
+            yield own
+
+
+def _iter_rows(conn, sql, params=()):
+    """Run a SELECT and yield the rows as dicts straight off the cursor."""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    for row in cursor.execute(sql, params):
+        yield dict(row)
+
 
-    return fetched_at - delta
+def _query(conn, sql, params=()):
+    """Run a SELECT and return the rows as dicts."""
+    return list(_iter_rows(conn, sql, params))
 
 
-def init_db(db_path=DEFAULT_DB_PATH):
-    """Create the posts table if it doesn't exist."""
-    conn = sqlite3.connect(db_path)
+def _add_column(conn, table, column, decl):
+    """Add a column to an existing table unless it is already there."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _migrate_base_tables(conn):
+    """v1: posts and fetches, as created before the schema was versioned."""
     conn.execute("""
         CREATE TABLE IF NOT EXISTS posts (
             url TEXT PRIMARY KEY,
@@ -77,218 +323,2837 @@ def init_db(db_path=DEFAULT_DB_PATH):
             inserted INTEGER NOT NULL
         )
     """)
-    conn.commit()
-    conn.close()
+    _add_column(conn, "fetches", "cutoff_offset", "INTEGER")
 
 
-def store_posts(db_path, posts):
-    """Insert new posts into the database. Returns count of newly inserted posts."""
-    conn = sqlite3.connect(db_path)
-    now = datetime.now(timezone.utc)
-    now_iso = now.isoformat()
-    inserted = 0
+def _migrate_query_indexes(conn):
+    """v2: indexes for the unprocessed backlog and posted_at range queries."""
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_posts_unprocessed ON posts (processed) WHERE processed = 0"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_posted_at ON posts (posted_at)")
 
-    for p in posts:
-        url = p.get("url")
-        if not url:
-            continue
 
-        posted_at = estimate_posted_at(p.get("old", ""), now)
-        posted_at_iso = posted_at.isoformat() if posted_at else None
+def _migrate_search_index(conn):
+    """v3: FTS5 index over content and author_name, kept in sync by triggers."""
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(content, author_name, content='')"
+    )
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts (rowid, content, author_name)
+            VALUES (new.rowid, new.content, new.author_name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, author_name)
+            VALUES ('delete', old.rowid, old.content, old.author_name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF content, author_name ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, author_name)
+            VALUES ('delete', old.rowid, old.content, old.author_name);
+            INSERT INTO posts_fts (rowid, content, author_name)
+            VALUES (new.rowid, new.content, new.author_name);
+        END
+    """)
+    conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('delete-all')")
+    conn.execute("INSERT INTO posts_fts (rowid, content, author_name) "
+                 "SELECT rowid, content, author_name FROM posts")
 
-        try:
-            conn.execute(
-                "INSERT INTO posts (url, author_name, author_profile, content, posted_at, fetched_at) "
-                "VALUES (?, ?, ?, ?, ?, ?)",
-                (url, p.get("author_name", ""), p.get("author_profile", ""),
-                 p.get("content", ""), posted_at_iso, now_iso),
-            )
-            inserted += 1
-        except sqlite3.IntegrityError:
-            pass
 
-    conn.commit()
-    conn.close()
-    return inserted
+def _migrate_near_duplicates(conn):
+    """v4: SimHash fingerprints, cluster ids and the LSH band index.
 
+    simhashes maps each distinct fingerprint to its cluster, and
+    simhash_bands indexes those fingerprints by band for candidate lookup.
+    Existing posts are left unclustered until cluster_posts runs.
+    """
+    _add_column(conn, "posts", "simhash", "INTEGER")
+    _add_column(conn, "posts", "cluster_id", "INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_cluster ON posts (cluster_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS simhashes (
+            simhash INTEGER PRIMARY KEY,
+            cluster_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS simhash_bands (
+            key INTEGER NOT NULL,
+            simhash INTEGER NOT NULL,
+            PRIMARY KEY (key, simhash)
+        ) WITHOUT ROWID
+    """)
 
-def get_unprocessed(db_path=DEFAULT_DB_PATH):
-    """Return all unprocessed posts as a list of dicts."""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute(
-        "SELECT url, author_name, author_profile, content, posted_at, fetched_at "
-        "FROM posts WHERE processed = 0 ORDER BY rowid"
-    ).fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
+def _migrate_scores(conn):
+    """v5: cached pre-scores for the briefing's content angles."""
+    _add_column(conn, "posts", "score", "REAL")
+    _add_column(conn, "posts", "score_version", "TEXT")
 
-def get_posts(db_path=DEFAULT_DB_PATH, after=None, before=None):
-    """Return posts filtered by posted_at date range.
 
-    Both processed and unprocessed posts are included.
-    Posts without a posted_at value are excluded.
-    Results ordered by posted_at ascending.
+def _migrate_fetch_telemetry(conn):
+    """v6: per-run phase timings and per-batch API telemetry for fetches."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetch_phases (
+            fetch_id INTEGER PRIMARY KEY REFERENCES fetches (id),
+            api_ms REAL,
+            parse_ms REAL,
+            insert_ms REAL,
+            commit_ms REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetch_batches (
+            fetch_id INTEGER NOT NULL REFERENCES fetches (id),
+            batch_offset INTEGER NOT NULL,
+            latency_ms REAL NOT NULL,
+            attempts INTEGER NOT NULL,
+            posts INTEGER NOT NULL,
+            error TEXT,
+            PRIMARY KEY (fetch_id, batch_offset)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fetch_batches_latency ON fetch_batches (latency_ms)")
+
+
+def _migrate_accounts(conn):
+    """v7: an account dimension, with posts unique per (account, url).
+
+    SQLite can't change a primary key in place, so posts is rebuilt.
+    Rowids are kept (the search index and cluster ids refer to them) and
+    become an explicit id column so VACUUM can't renumber them; indexes
+    and search triggers are recreated on the new table.
     """
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    clauses = ["posted_at IS NOT NULL"]
-    params = []
-    if after is not None:
-        clauses.append("posted_at > ?")
-        params.append(after.isoformat())
-    if before is not None:
-        clauses.append("posted_at < ?")
-        params.append(before.isoformat())
-    where = " AND ".join(clauses)
-    rows = conn.execute(
-        f"SELECT url, author_name, author_profile, content, posted_at, fetched_at, processed "
-        f"FROM posts WHERE {where} ORDER BY posted_at",
-        params,
-    ).fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    conn.execute("""
+        CREATE TABLE posts_new (
+            id INTEGER PRIMARY KEY,
+            account TEXT NOT NULL DEFAULT '',
+            url TEXT NOT NULL,
+            author_name TEXT,
+            author_profile TEXT,
+            content TEXT,
+            posted_at TEXT,
+            fetched_at TEXT NOT NULL,
+            processed INTEGER NOT NULL DEFAULT 0,
+            simhash INTEGER,
+            cluster_id INTEGER,
+            score REAL,
+            score_version TEXT,
+            UNIQUE (account, url)
+        )
+    """)
+    columns = ("url, author_name, author_profile, content, posted_at, fetched_at, processed, "
+               "simhash, cluster_id, score, score_version")
+    conn.execute(f"INSERT INTO posts_new (id, {columns}) SELECT rowid, {columns} FROM posts")
+    conn.execute("DROP TABLE posts")
+    conn.execute("ALTER TABLE posts_new RENAME TO posts")
+    conn.execute("CREATE INDEX idx_posts_unprocessed ON posts (processed) WHERE processed = 0")
+    conn.execute("CREATE INDEX idx_posts_posted_at ON posts (posted_at)")
+    conn.execute("CREATE INDEX idx_posts_cluster ON posts (cluster_id)")
+    conn.execute("CREATE INDEX idx_posts_url ON posts (url)")
+    conn.execute("""
+        CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts (rowid, content, author_name)
+            VALUES (new.rowid, new.content, new.author_name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, author_name)
+            VALUES ('delete', old.rowid, old.content, old.author_name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER posts_fts_update AFTER UPDATE OF content, author_name ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, author_name)
+            VALUES ('delete', old.rowid, old.content, old.author_name);
+            INSERT INTO posts_fts (rowid, content, author_name)
+            VALUES (new.rowid, new.content, new.author_name);
+        END
+    """)
+    _add_column(conn, "fetches", "account", "TEXT NOT NULL DEFAULT ''")
 
 
-def mark_processed(db_path, urls):
-    """Mark posts as processed by their URLs."""
-    conn = sqlite3.connect(db_path)
-    conn.executemany(
-        "UPDATE posts SET processed = 1 WHERE url = ?",
-        [(url,) for url in urls],
-    )
-    conn.commit()
-    conn.close()
+def _migrate_processed_batches(conn):
+    """v8: when and in which mark-processed batch each post was processed."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS processed_batches (
+            id INTEGER PRIMARY KEY,
+            marked_at TEXT NOT NULL,
+            account TEXT,
+            marked INTEGER NOT NULL DEFAULT 0,
+            undone_at TEXT
+        )
+    """)
+    _add_column(conn, "posts", "processed_at", "TEXT")
+    _add_column(conn, "posts", "processed_batch", "INTEGER REFERENCES processed_batches (id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_processed_batch ON posts (processed_batch) "
+                 "WHERE processed_batch IS NOT NULL")
 
 
-def log_fetch(db_path, fetched, inserted):
-    """Record a fetch operation in the audit log."""
-    conn = sqlite3.connect(db_path)
-    conn.execute(
-        "INSERT INTO fetches (started_at, fetched, inserted) VALUES (?, ?, ?)",
-        (datetime.now(timezone.utc).isoformat(), fetched, inserted),
-    )
-    conn.commit()
-    conn.close()
+def _migrate_leases(conn):
+    """v9: leases that let several workers claim unprocessed posts."""
+    _add_column(conn, "posts", "lease_id", "TEXT")
+    _add_column(conn, "posts", "lease_expires_at", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_lease ON posts (lease_id) "
+                 "WHERE lease_id IS NOT NULL")
 
 
-def get_fetch_log(db_path=DEFAULT_DB_PATH):
-    """Return the fetch audit log, most recent first."""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute(
-        "SELECT started_at, fetched, inserted FROM fetches ORDER BY id DESC"
-    ).fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+def _migrate_exports(conn):
+    """v10: export runs and their chunk files, for incremental exports."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS exports (
+            id INTEGER PRIMARY KEY,
+            directory TEXT NOT NULL,
+            exported_at TEXT NOT NULL,
+            format TEXT NOT NULL,
+            watermark INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            bytes INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_exports_directory ON exports (directory, watermark)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_chunks (
+            export_id INTEGER NOT NULL REFERENCES exports (id),
+            file TEXT NOT NULL,
+            day TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            min_posted_at TEXT,
+            max_posted_at TEXT,
+            PRIMARY KEY (export_id, file)
+        ) WITHOUT ROWID
+    """)
 
 
-RETRY_DELAY = 3
+def _migrate_authors(conn):
+    """v11: authors interned into their own table, with running aggregates.
+
+    posts keeps only author_id. authors.key is the profile URL, or the
+    name for posts without one. post_count, first/last_seen_at and
+    last_posted_at are maintained by triggers on posts. The search
+    triggers now read the name from authors, and renaming an author
+    re-indexes their posts.
+    """
+    conn.execute("""
+        CREATE TABLE authors (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL DEFAULT '',
+            profile TEXT NOT NULL DEFAULT '',
+            post_count INTEGER NOT NULL DEFAULT 0,
+            first_seen_at TEXT,
+            last_seen_at TEXT,
+            last_posted_at TEXT
+        )
+    """)
+    key_sql = ("CASE WHEN COALESCE(author_profile, '') != '' THEN author_profile "
+               "ELSE 'name:' || COALESCE(author_name, '') END")
+    # The bare author_name/author_profile come from the row with MAX(rowid),
+    # so an author's latest name wins.
+    conn.execute(f"""
+        INSERT INTO authors (key, name, profile, post_count, first_seen_at, last_seen_at,
+                             last_posted_at)
+        SELECT key, COALESCE(author_name, ''), COALESCE(author_profile, ''), post_count,
+               first_seen_at, last_seen_at, last_posted_at
+        FROM (SELECT {key_sql} AS key, author_name, author_profile, MAX(rowid),
+                     COUNT(*) AS post_count, MIN(fetched_at) AS first_seen_at,
+                     MAX(fetched_at) AS last_seen_at, MAX(posted_at) AS last_posted_at
+              FROM posts GROUP BY key)
+    """)
+    _add_column(conn, "posts", "author_id", "INTEGER REFERENCES authors (id)")
+    conn.execute(f"UPDATE posts SET author_id = (SELECT id FROM authors WHERE key = {key_sql})")
+    for trigger in ("posts_fts_insert", "posts_fts_delete", "posts_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("ALTER TABLE posts DROP COLUMN author_name")
+    conn.execute("ALTER TABLE posts DROP COLUMN author_profile")
+    conn.execute("CREATE INDEX idx_posts_author ON posts (author_id, posted_at)")
+    conn.execute("""
+        CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts (rowid, content, author_name)
+            VALUES (new.rowid, new.content,
+                    (SELECT name FROM authors WHERE authors.id = new.author_id));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, author_name)
+            VALUES ('delete', old.rowid, old.content,
+                    (SELECT name FROM authors WHERE authors.id = old.author_id));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER posts_fts_update AFTER UPDATE OF content, author_id ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, author_name)
+            VALUES ('delete', old.rowid, old.content,
+                    (SELECT name FROM authors WHERE authors.id = old.author_id));
+            INSERT INTO posts_fts (rowid, content, author_name)
+            VALUES (new.rowid, new.content,
+                    (SELECT name FROM authors WHERE authors.id = new.author_id));
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER authors_fts_rename AFTER UPDATE OF name ON authors BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, author_name)
+            SELECT 'delete', rowid, content, old.name FROM posts WHERE author_id = old.id;
+            INSERT INTO posts_fts (rowid, content, author_name)
+            SELECT rowid, content, new.name FROM posts WHERE author_id = new.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER authors_count_insert AFTER INSERT ON posts BEGIN
+            UPDATE authors SET
+                post_count = post_count + 1,
+                first_seen_at = COALESCE(first_seen_at, new.fetched_at),
+                last_seen_at = MAX(COALESCE(last_seen_at, ''), new.fetched_at),
+                last_posted_at = CASE WHEN new.posted_at > COALESCE(last_posted_at, '')
+                                      THEN new.posted_at ELSE last_posted_at END
+            WHERE id = new.author_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER authors_count_delete AFTER DELETE ON posts BEGIN
+            UPDATE authors SET post_count = post_count - 1 WHERE id = old.author_id;
+        END
+    """)
+    conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('delete-all')")
+    conn.execute("INSERT INTO posts_fts (rowid, content, author_name) "
+                 "SELECT p.rowid, p.content, a.name FROM posts p JOIN authors a ON a.id = p.author_id")
 
 
-def fetch_feed_batched(get_feed_posts_fn, limit=DEFAULT_LIMIT, retry_delay=RETRY_DELAY):
-    """Fetch feed posts in batches of BATCH_SIZE.
+def _migrate_daily_rollups(conn):
+    """v12: per-day rollups of posts and fetch/mark activity, backfilled once.
 
-    Accepts a callable (e.g. api.get_feed_posts) to allow testing
-    without hitting the real API. Stops when the API returns zero posts.
-    Retries once per batch on failure; returns partial results if retry fails.
+    daily_posts is keyed by posted_at day, daily_activity by the day a
+    fetch ran, a post was stored or a post was marked processed. The
+    backfill counts what rebuild_trends does, as of this version.
     """
-    all_posts = []
-    offset = 0
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_posts (
+            day TEXT NOT NULL,
+            account TEXT NOT NULL,
+            posts INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, account)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_activity (
+            day TEXT NOT NULL,
+            account TEXT NOT NULL,
+            fetches INTEGER NOT NULL DEFAULT 0,
+            fetched INTEGER NOT NULL DEFAULT 0,
+            stored INTEGER NOT NULL DEFAULT 0,
+            marked INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, account)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        INSERT INTO daily_posts (day, account, posts, processed)
+        SELECT COALESCE(substr(posted_at, 1, 10), 'undated') AS day, account,
+               COUNT(*), SUM(processed != 0)
+        FROM posts GROUP BY day, account
+    """)
+    conn.execute("""
+        INSERT INTO daily_activity (day, account, fetches, fetched, stored, marked)
+        SELECT day, account, SUM(fetches), SUM(fetched), SUM(stored), SUM(marked) FROM (
+            SELECT substr(fetched_at, 1, 10) AS day, account,
+                   0 AS fetches, 0 AS fetched, COUNT(*) AS stored, 0 AS marked
+            FROM posts GROUP BY day, account
+            UNION ALL
+            SELECT substr(COALESCE(processed_at, fetched_at), 1, 10) AS day, account,
+                   0, 0, 0, COUNT(*)
+            FROM posts WHERE processed != 0 GROUP BY day, account
+            UNION ALL
+            SELECT substr(started_at, 1, 10) AS day, account, COUNT(*), SUM(fetched), 0, 0
+            FROM fetches GROUP BY day, account
+        )
+        GROUP BY day, account
+    """)
 
-    while len(all_posts) < limit:
-        try:
-            batch = get_feed_posts_fn(limit=BATCH_SIZE, offset=offset)
-        except Exception:
+
+# Append new migrations at the end; never reorder or edit applied ones.
+MIGRATIONS = [
+    _migrate_base_tables,
+    _migrate_query_indexes,
+    _migrate_search_index,
+    _migrate_near_duplicates,
+    _migrate_scores,
+    _migrate_fetch_telemetry,
+    _migrate_accounts,
+    _migrate_processed_batches,
+    _migrate_leases,
+    _migrate_exports,
+    _migrate_authors,
+    _migrate_daily_rollups,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def init_db(db_path=DEFAULT_DB_PATH, conn=None):
+    """Create the schema, or upgrade an existing database in place.
+
+    The applied version is kept in PRAGMA user_version. Each pending
+    migration runs in its own savepoint together with the version bump.
+    """
+    with _connection(db_path, conn) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.execute("SAVEPOINT migrate")
             try:
-                time.sleep(retry_delay)
-                batch = get_feed_posts_fn(limit=BATCH_SIZE, offset=offset)
-            except Exception as exc:
-                print(f"Batch at offset {offset} failed after retry: {exc}", file=sys.stderr)
-                break
-        if not batch:
-            break
-        all_posts.extend(batch)
-        offset += BATCH_SIZE
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            except Exception:
+                conn.execute("ROLLBACK TO migrate")
+                raise
+            finally:
+                conn.execute("RELEASE migrate")
 
-    return all_posts[:limit]
 
+DEFAULT_ACCOUNT = ""
 
-def fetch_feed(jsessionid, li_at, limit=DEFAULT_LIMIT):
-    """Authenticate via cookies and return feed posts in batches."""
-    jar = RequestsCookieJar()
-    jsessionid = jsessionid.strip('"')
-    jar.set("JSESSIONID", f'"{jsessionid}"', domain=".linkedin.com")
-    jar.set("li_at", li_at, domain=".linkedin.com")
 
-    api = Linkedin("", "", cookies=jar)
-    return fetch_feed_batched(api.get_feed_posts, limit=limit)
+def _account_clauses(account, column="account"):
+    """Filter for one account's posts, or no filter when account is None."""
+    if account is None:
+        return [], []
+    return [f"{column} = ?"], [account]
 
 
-def main():
-    import argparse
+def store_posts(db_path, posts, conn=None, stats=None, account=DEFAULT_ACCOUNT):
+    """Insert new posts into the database. Returns count of newly inserted posts."""
+    return len(ingest_posts(db_path, posts, conn=conn, stats=stats, account=account))
 
-    parser = argparse.ArgumentParser(description="LinkedIn feed tool")
-    subparsers = parser.add_subparsers(dest="command", required=True)
 
-    fetch_parser = subparsers.add_parser("fetch", help="Fetch posts from LinkedIn")
-    fetch_parser.add_argument(
-        "limit", nargs="?", type=int, default=DEFAULT_LIMIT,
-        help=f"Number of posts to fetch (default: {DEFAULT_LIMIT})",
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def ingest_posts(db_path, posts, conn=None, stats=None, account=DEFAULT_ACCOUNT):
+    """Bulk-insert posts and return the URLs that were new, in feed order.
+
+    Rows are normalized in one pass and loaded with a single
+    INSERT OR IGNORE executemany, so duplicates are skipped by SQLite
+    instead of raising. Posts belong to account; the same URL seen by
+    another account is stored again with its own processed flag.
+    New rows are the ones past the previous max rowid.
+    With a stats dict, the normalize and insert timings are written to
+    stats["parse_ms"] and stats["insert_ms"].
+    """
+    if stats is None:
+        stats = {}
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    posts = [p for p in posts if p.get("url")]
+    posted_ats = estimate_posted_at_batch([p.get("old", "") for p in posts], now)
+    iso = {}
+    rows = []
+
+    authors = {}
+    for p, posted_at in zip(posts, posted_ats):
+        if posted_at not in iso:
+            iso[posted_at] = posted_at.isoformat() if posted_at else None
+        name, profile = p.get("author_name") or "", p.get("author_profile") or ""
+        key = profile or f"name:{name}"
+        authors.setdefault(key, (key, name, profile))
+        rows.append((account, p["url"], key, p.get("content", ""), iso[posted_at], now_iso))
+    stats["parse_ms"] = _elapsed_ms(started)
+
+    if not rows:
+        stats["insert_ms"] = 0.0
+        return []
+
+    started = time.perf_counter()
+    with _connection(db_path, conn) as conn:
+        author_ids = _intern_authors(conn, authors.values())
+        last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM posts").fetchone()[0]
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO posts "
+            "(account, url, author_id, content, posted_at, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [row[:2] + (author_ids[row[2]],) + row[3:] for row in rows],
+        )
+        new_rows = []
+        if cursor.rowcount:
+            new_rows = conn.execute(
+                "SELECT rowid, url FROM posts WHERE rowid > ? ORDER BY rowid", (last_rowid,)
+            ).fetchall()
+            _roll_up(conn, "daily_posts", POSTED_DAY_SQL, {"posts": "COUNT(*)"},
+                     "rowid > ?", [last_rowid])
+            _roll_up(conn, "daily_activity", "substr(fetched_at, 1, 10)", {"stored": "COUNT(*)"},
+                     "rowid > ?", [last_rowid])
+        stats["insert_ms"] = _elapsed_ms(started)
+        return [url for _, url in new_rows]
+
+
+def _intern_authors(conn, authors):
+    """Upsert (key, name, profile) authors and return {key: author id}.
+
+    A known author keeps their id; a changed name replaces the stored one.
+    """
+    authors = list(authors)
+    conn.executemany(
+        "INSERT INTO authors (key, name, profile) VALUES (?, ?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET name = excluded.name WHERE name != excluded.name",
+        authors,
     )
+    return dict(conn.execute(
+        "SELECT key, id FROM authors WHERE key IN (SELECT value FROM json_each(?))",
+        (json.dumps([key for key, _, _ in authors]),),
+    ).fetchall())
 
-    subparsers.add_parser("unprocessed", help="Show unprocessed posts as JSON")
 
-    mark_parser = subparsers.add_parser("mark-processed", help="Mark posts as processed")
-    mark_parser.add_argument("urls", nargs="*", help="URLs to mark as processed")
-    mark_parser.add_argument("--all", action="store_true", help="Mark all unprocessed posts")
+CLUSTER_BATCH = 1000
 
-    posts_parser = subparsers.add_parser("posts", help="Show posts filtered by date as JSON")
-    posts_parser.add_argument("--after", help="Only posts after this date (ISO 8601)")
-    posts_parser.add_argument("--before", help="Only posts before this date (ISO 8601)")
 
-    args = parser.parse_args()
-    db_path = os.environ.get("LINKEDIN_DB_PATH", DEFAULT_DB_PATH)
-    init_db(db_path)
+def cluster_posts(db_path=DEFAULT_DB_PATH, conn=None):
+    """Fingerprint and cluster posts that have no cluster yet.
 
-    if args.command == "fetch":
-        jsessionid = os.environ.get("LINKEDIN_JSESSIONID")
-        li_at = os.environ.get("LINKEDIN_LI_AT")
+    Ingest leaves cluster_id NULL so bulk loads don't pay for SimHash;
+    the collapse and with_duplicates queries, the export and the fetch
+    daemon call this first. Returns the number of posts clustered.
+    """
+    clustered = 0
+    with _connection(db_path, conn) as conn:
+        while True:
+            batch = conn.execute(
+                "SELECT rowid, content FROM posts WHERE cluster_id IS NULL "
+                "ORDER BY rowid LIMIT ?",
+                (CLUSTER_BATCH,),
+            ).fetchall()
+            if not batch:
+                return clustered
+            _assign_clusters(conn, batch)
+            clustered += len(batch)
 
-        if not jsessionid or not li_at:
-            print(
-                "Set LINKEDIN_JSESSIONID and LINKEDIN_LI_AT environment variables.",
-                file=sys.stderr,
-            )
-            sys.exit(1)
 
-        posts = fetch_feed(jsessionid, li_at, limit=args.limit)
-        new_count = store_posts(db_path, posts)
-        log_fetch(db_path, fetched=len(posts), inserted=new_count)
-        unprocessed = get_unprocessed(db_path)
+def _assign_clusters(conn, rows):
+    """Fingerprint (rowid, content) rows and put each in a near-duplicate cluster.
 
-        print(f"Fetched:      {len(posts)}")
-        print(f"New:          {new_count}")
-        print(f"Unprocessed:  {len(unprocessed)}")
+    Identical contents are fingerprinted once. Known fingerprints and the
+    band candidates of new ones are each fetched with one json_each
+    query for the whole batch, through the simhashes primary key and the
+    simhash_bands index. A post joins the oldest cluster within
+    SIMHASH_MAX_DISTANCE bits, otherwise it starts its own
+    (cluster_id = its rowid); posts earlier in the batch count as well.
+    """
+    fingerprints = {}
+    values = []
+    for rowid, content in rows:
+        if content not in fingerprints:
+            fingerprints[content] = simhash(content)
+        values.append((rowid, fingerprints[content]))
+    distinct = {value for _, value in values if value is not None}
+    clusters = dict(conn.execute(
+        "SELECT simhash, cluster_id FROM simhashes "
+        "WHERE simhash IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(distinct)),),
+    ).fetchall())
+    band_keys = {key for value in distinct - clusters.keys() for key in simhash_bands(value)}
+    bands = {}
+    for key, other, cluster_id in conn.execute(
+        "SELECT b.key, s.simhash, s.cluster_id FROM simhash_bands b "
+        "JOIN simhashes s ON s.simhash = b.simhash "
+        "WHERE b.key IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(band_keys)),),
+    ):
+        bands.setdefault(key, []).append((other, cluster_id))
 
-    elif args.command == "unprocessed":
-        posts = get_unprocessed(db_path)
-        print(json.dumps(posts, indent=2, ensure_ascii=False))
+    new_hashes, new_bands, updates = [], [], []
+    for rowid, value in values:
+        if value is None:
+            updates.append((None, rowid, rowid))
+            continue
+        if value not in clusters:
+            keys = simhash_bands(value)
+            matches = [cluster_id for key in keys for other, cluster_id in bands.get(key, ())
+                       if hamming_distance(value, other) <= SIMHASH_MAX_DISTANCE]
+            clusters[value] = min(matches) if matches else rowid
+            new_hashes.append((value, clusters[value]))
+            for key in keys:
+                bands.setdefault(key, []).append((value, clusters[value]))
+                new_bands.append((key, value))
+        updates.append((value, clusters[value], rowid))
+    conn.executemany("INSERT INTO simhashes (simhash, cluster_id) VALUES (?, ?)", new_hashes)
+    conn.executemany("INSERT OR IGNORE INTO simhash_bands (key, simhash) VALUES (?, ?)",
+                     new_bands)
+    conn.executemany("UPDATE posts SET simhash = ?, cluster_id = ? WHERE rowid = ?", updates)
 
-    elif args.command == "posts":
-        after = datetime.fromisoformat(args.after) if args.after else None
-        before = datetime.fromisoformat(args.before) if args.before else None
-        posts = get_posts(db_path, after=after, before=before)
-        print(json.dumps(posts, indent=2, ensure_ascii=False))
 
-    elif args.command == "mark-processed":
-        if getattr(args, "all"):
-            urls = [p["url"] for p in get_unprocessed(db_path)]
-        else:
-            urls = args.urls
-        mark_processed(db_path, urls)
-        print(f"Marked {len(urls)} post(s) as processed.")
+def get_known_urls(db_path, urls, conn=None, account=None):
+    """Return the subset of urls that are already stored (for account, if given)."""
+    clauses, params = _account_clauses(account)
+    where = " AND ".join(["url IN (SELECT value FROM json_each(?))"] + clauses)
+    with _connection(db_path, conn) as conn:
+        rows = conn.execute(
+            f"SELECT url FROM posts WHERE {where}", [json.dumps(list(urls))] + params,
+        ).fetchall()
+    return {row[0] for row in rows}
+
+
+def get_unprocessed(db_path=DEFAULT_DB_PATH, conn=None, collapse=False, min_score=None,
+                    account=None):
+    """Return all unprocessed posts as a list of dicts.
+
+    With collapse=True only the oldest post of each near-duplicate
+    cluster is returned. min_score keeps posts whose cached score (see
+    score_posts) is at least that value. account limits the result to
+    one account's posts.
+    """
+    return list(iter_unprocessed(db_path, conn=conn, collapse=collapse, min_score=min_score,
+                                 account=account))
+
+
+def _unprocessed_filter(collapse=False, min_score=None, account=None):
+    """WHERE clause and params for the unprocessed queries."""
+    clauses, params = _account_clauses(account)
+    where = " AND ".join(["processed = 0"] + clauses)
+    if collapse:
+        where += " AND " + _representatives(where)
+        params = params * 2
+    if min_score is not None:
+        where += " AND score >= ?"
+        params.append(min_score)
+    return where, params
+
+
+# Post queries select from POSTS_WITH_AUTHORS, so filters must write
+# posts.rowid / posts.id (the only names both tables have). A post shows
+# its author's current name; a missing name or profile is ''.
+POSTS_WITH_AUTHORS = "posts LEFT JOIN authors ON authors.id = posts.author_id"
+AUTHOR_FIELDS = "authors.name AS author_name, authors.profile AS author_profile"
+UNPROCESSED_FIELDS = f"url, {AUTHOR_FIELDS}, content, posted_at, fetched_at"
+
+
+def iter_unprocessed(db_path=DEFAULT_DB_PATH, conn=None, collapse=False, min_score=None,
+                     account=None):
+    """Yield unprocessed posts one at a time, without loading the backlog."""
+    where, params = _unprocessed_filter(collapse, min_score, account)
+    with _connection(db_path, conn) as conn:
+        if collapse:
+            cluster_posts(conn=conn)
+        yield from _iter_rows(
+            conn,
+            f"SELECT {UNPROCESSED_FIELDS} FROM {POSTS_WITH_AUTHORS} WHERE {where} "
+            f"ORDER BY posts.rowid",
+            params,
+        )
+
+
+PAGE_SIZE = 100
+
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor, length):
+    """Return the key list of a page cursor; ValueError if it isn't one."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        key = None
+    if not isinstance(key, list) or len(key) != length:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return key
+
+
+def _check_limit(limit):
+    """Raise ValueError unless limit is at least 1 (SQLite reads LIMIT -1 as no limit)."""
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1, got {limit}")
+
+
+def _page(conn, select, where, params, order, limit, cursor_columns):
+    """Run one keyset page query; return {"posts", "next_cursor"}.
+
+    The query fetches limit + 1 rows to learn whether another page
+    follows. cursor_columns are the selected columns, in sort order, that
+    make up the key. select must start with id, which is dropped from
+    the returned posts. Raises ValueError for a limit below 1.
+    """
+    _check_limit(limit)
+    rows = _query(conn, f"SELECT {select} FROM {POSTS_WITH_AUTHORS} WHERE {where} "
+                        f"ORDER BY {order} LIMIT ?",
+                  params + [limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([rows[-1][column] for column in cursor_columns])
+    for row in rows:
+        row.pop("id")
+    return {"posts": rows, "next_cursor": next_cursor}
+
+
+def get_unprocessed_page(db_path=DEFAULT_DB_PATH, limit=PAGE_SIZE, cursor=None, conn=None,
+                         collapse=False, min_score=None, account=None):
+    """Return one page of unprocessed posts, keyed on rowid.
+
+    Pass the previous page's next_cursor (None on the last page) to get
+    the page after it. Each page is an index seek past the cursor, so
+    its cost doesn't grow with depth. Filters are the same as
+    get_unprocessed.
+    """
+    where, params = _unprocessed_filter(collapse, min_score, account)
+    if cursor is not None:
+        where += " AND posts.rowid > ?"
+        params += _decode_cursor(cursor, 1)
+    with _connection(db_path, conn) as conn:
+        if collapse:
+            cluster_posts(conn=conn)
+        return _page(conn, f"posts.id AS id, {UNPROCESSED_FIELDS}", where, params, "posts.rowid",
+                     limit, ["id"])
+
+
+def iter_pages(page_fn, db_path=DEFAULT_DB_PATH, page_size=PAGE_SIZE, **options):
+    """Yield every post of a paged query, fetching one page at a time.
+
+    page_fn is get_unprocessed_page or get_posts_page; options are its
+    filters.
+    """
+    cursor = None
+    while True:
+        page = page_fn(db_path, limit=page_size, cursor=cursor, **options)
+        yield from page["posts"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return
+
+
+def _representatives(where):
+    """SQL condition keeping the oldest matching post of each cluster."""
+    return (f"posts.rowid IN (SELECT MIN(rowid) FROM posts WHERE {where} "
+            f"GROUP BY COALESCE(cluster_id, rowid))")
+
+
+def count_unprocessed(db_path=DEFAULT_DB_PATH, conn=None, account=None):
+    """Return the number of unprocessed posts (for account, if given)."""
+    clauses, params = _account_clauses(account)
+    where = " AND ".join(["processed = 0"] + clauses)
+    with _connection(db_path, conn) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM posts WHERE {where}", params).fetchone()[0]
+
+
+def get_posts(db_path=DEFAULT_DB_PATH, after=None, before=None, conn=None, collapse=False,
+              account=None):
+    """Return posts filtered by posted_at date range.
+
+    Both processed and unprocessed posts are included.
+    Posts without a posted_at value are excluded.
+    Results ordered by posted_at ascending.
+    With collapse=True only one post per near-duplicate cluster is kept.
+    account limits the result to one account's posts.
+    """
+    return list(iter_posts(db_path, after=after, before=before, conn=conn, collapse=collapse,
+                           account=account))
+
+
+def _date_clauses(after, before, column="posted_at"):
+    """Build the posted_at range filter shared by the date-bounded queries."""
+    clauses = [f"{column} IS NOT NULL"]
+    params = []
+    if after is not None:
+        clauses.append(f"{column} > ?")
+        params.append(after.isoformat())
+    if before is not None:
+        clauses.append(f"{column} < ?")
+        params.append(before.isoformat())
+    return clauses, params
+
+
+def _posts_filter(after=None, before=None, collapse=False, account=None):
+    """WHERE clause and params for the date-bounded post queries."""
+    clauses, params = _date_clauses(after, before)
+    account_clauses, account_params = _account_clauses(account)
+    clauses += account_clauses
+    params += account_params
+    where = " AND ".join(clauses)
+    if collapse:
+        where += " AND " + _representatives(where)
+        params = params * 2
+    return where, params
+
+
+POST_FIELDS = f"url, {AUTHOR_FIELDS}, content, posted_at, fetched_at, processed"
+
+
+def iter_posts(db_path=DEFAULT_DB_PATH, after=None, before=None, conn=None, collapse=False,
+               account=None):
+    """Yield the posts get_posts would return, one at a time."""
+    where, params = _posts_filter(after, before, collapse, account)
+    with _connection(db_path, conn) as conn:
+        if collapse:
+            cluster_posts(conn=conn)
+        yield from _iter_rows(
+            conn,
+            f"SELECT {POST_FIELDS} FROM {POSTS_WITH_AUTHORS} WHERE {where} "
+            f"ORDER BY posted_at, posts.rowid",
+            params,
+        )
+
+
+def get_posts_page(db_path=DEFAULT_DB_PATH, after=None, before=None, limit=PAGE_SIZE,
+                   cursor=None, conn=None, collapse=False, account=None):
+    """Return one page of the posts get_posts would return.
+
+    Keyed on (posted_at, rowid), which the posted_at index already
+    orders, so every page is a seek; see get_unprocessed_page for the
+    cursor protocol.
+    """
+    where, params = _posts_filter(after, before, collapse, account)
+    if cursor is not None:
+        where += " AND (posted_at, posts.rowid) > (?, ?)"
+        params += _decode_cursor(cursor, 2)
+    with _connection(db_path, conn) as conn:
+        if collapse:
+            cluster_posts(conn=conn)
+        return _page(conn, f"posts.id AS id, {POST_FIELDS}", where, params,
+                     "posted_at, posts.rowid", limit,
+                     ["posted_at", "id"])
+
+
+AUTHORS_LIMIT = 50
+
+
+def get_authors(db_path=DEFAULT_DB_PATH, limit=AUTHORS_LIMIT, conn=None):
+    """Return the most prolific authors with their running aggregates.
+
+    Reads the counters kept on authors, so the cost depends on the number
+    of authors, not posts.
+    """
+    with _connection(db_path, conn) as conn:
+        return _query(
+            conn,
+            "SELECT name, profile, post_count, first_seen_at, last_seen_at, last_posted_at "
+            "FROM authors WHERE post_count > 0 ORDER BY post_count DESC, last_seen_at DESC LIMIT ?",
+            (limit,),
+        )
+
+
+SEARCH_LIMIT = 20
+
+
+def search_posts(db_path=DEFAULT_DB_PATH, query="", after=None, before=None, processed=None,
+                 limit=SEARCH_LIMIT, conn=None, account=None):
+    """Full-text search over content and author_name, best matches first.
+
+    query uses FTS5 syntax (words, "phrases", OR, NOT, prefix*). Date
+    bounds behave like get_posts; processed=True/False restricts to
+    processed or unprocessed posts, account to one account's posts.
+    Each result carries its bm25 rank (lower is better).
+    """
+    clauses = ["posts_fts MATCH ?"]
+    params = [query]
+    if after is not None or before is not None:
+        date_clauses, date_params = _date_clauses(after, before, column="p.posted_at")
+        clauses += date_clauses
+        params += date_params
+    if processed is not None:
+        clauses.append("p.processed = ?")
+        params.append(int(processed))
+    account_clauses, account_params = _account_clauses(account, column="p.account")
+    clauses += account_clauses
+    params += account_params
+    params.append(limit)
+    where = " AND ".join(clauses)
+    with _connection(db_path, conn) as conn:
+        return _query(
+            conn,
+            f"SELECT p.url, a.name AS author_name, a.profile AS author_profile, p.content, "
+            f"p.posted_at, p.fetched_at, p.processed, bm25(posts_fts) AS rank "
+            f"FROM posts_fts JOIN posts p ON p.rowid = posts_fts.rowid "
+            f"JOIN authors a ON a.id = p.author_id "
+            f"WHERE {where} ORDER BY rank LIMIT ?",
+            params,
+        )
+
+
+def rebuild_search_index(db_path=DEFAULT_DB_PATH, conn=None):
+    """Re-index every post in posts_fts. Returns the number of posts indexed."""
+    with _connection(db_path, conn) as conn:
+        conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('delete-all')")
+        cursor = conn.execute(
+            "INSERT INTO posts_fts (rowid, content, author_name) "
+            "SELECT p.rowid, p.content, a.name FROM posts p JOIN authors a ON a.id = p.author_id"
+        )
+        return cursor.rowcount
+
+
+def write_ndjson(rows, out=None):
+    """Write rows as compact JSON, one object per line, as they arrive.
+
+    The first line is flushed immediately so consumers can start early;
+    the rest goes through normal buffering.
+    """
+    out = out or sys.stdout
+    for i, row in enumerate(rows):
+        out.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        out.write("\n")
+        if i == 0:
+            out.flush()
+    out.flush()
+
+
+def _mark_batch(conn, account, where, params):
+    """Mark the unprocessed posts matching where as one new batch.
+
+    Returns {"batch_id", "marked"}, marked being the rows actually changed.
+    When nothing changed no batch is kept and batch_id is None.
+    """
+    marked_at = datetime.now(timezone.utc).isoformat()
+    batch_id = conn.execute(
+        "INSERT INTO processed_batches (marked_at, account) VALUES (?, ?)", (marked_at, account),
+    ).lastrowid
+    clauses, account_params = _account_clauses(account)
+    where = " AND ".join(["processed = 0"] + clauses + [where])
+    marked = conn.execute(
+        "UPDATE posts SET processed = 1, processed_at = ?, processed_batch = ?, "
+        f"lease_id = NULL, lease_expires_at = NULL WHERE {where}",
+        [marked_at, batch_id] + account_params + list(params),
+    ).rowcount
+    if not marked:
+        conn.execute("DELETE FROM processed_batches WHERE id = ?", (batch_id,))
+        return {"batch_id": None, "marked": 0}
+    conn.execute("UPDATE processed_batches SET marked = ? WHERE id = ?", (marked, batch_id))
+    _roll_up_batch(conn, batch_id)
+    return {"batch_id": batch_id, "marked": marked}
+
+
+def _roll_up_batch(conn, batch_id, sign=1):
+    """Add (or with sign=-1, take back) a mark-processed batch in the rollups."""
+    _roll_up(conn, "daily_posts", POSTED_DAY_SQL, {"processed": f"{sign} * COUNT(*)"},
+             "processed_batch = ?", [batch_id])
+    _roll_up(conn, "daily_activity", "substr(processed_at, 1, 10)",
+             {"marked": f"{sign} * COUNT(*)"}, "processed_batch = ?", [batch_id])
+
+
+def mark_processed(db_path, urls, conn=None, with_duplicates=False, account=None):
+    """Mark posts as processed by their URLs, as one audited batch.
+
+    The URLs are loaded into a temp table and applied with a single
+    UPDATE. With with_duplicates=True the near-duplicates of those posts
+    are marked too, so collapsed copies don't resurface in the next
+    briefing. With account, only that account's posts are marked;
+    otherwise the URLs are marked for every account. Posts that were
+    already processed keep their original batch.
+    Returns {"batch_id", "marked"}; see undo_processed.
+    """
+    where = "url IN (SELECT url FROM temp.mark_urls)"
+    params = []
+    if with_duplicates:
+        clauses, params = _account_clauses(account)
+        scope = "".join(f" AND {clause}" for clause in clauses)
+        where = (f"({where} OR cluster_id IN (SELECT cluster_id FROM posts "
+                 f"WHERE url IN (SELECT url FROM temp.mark_urls){scope}))")
+    with _connection(db_path, conn) as conn:
+        if with_duplicates:
+            cluster_posts(conn=conn)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS mark_urls (url TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.mark_urls")
+        conn.executemany("INSERT OR IGNORE INTO temp.mark_urls (url) VALUES (?)",
+                         [(url,) for url in urls])
+        result = _mark_batch(conn, account, where, params)
+        conn.execute("DELETE FROM temp.mark_urls")
+    return result
+
+
+def mark_all_processed(db_path=DEFAULT_DB_PATH, conn=None, account=None, now=None):
+    """Mark every unprocessed post (of account, if given) with one UPDATE.
+
+    Posts under a worker's unexpired lease are left for that worker to
+    ack or release, as claim_posts leaves them.
+    Returns {"batch_id", "marked"} like mark_processed.
+    """
+    now = now or datetime.now(timezone.utc)
+    with _connection(db_path, conn) as conn:
+        return _mark_batch(conn, account, "(lease_expires_at IS NULL OR lease_expires_at <= ?)",
+                           [now.isoformat()])
+
+
+def undo_processed(db_path, batch_id, conn=None):
+    """Return the posts of a mark-processed batch to the backlog.
+
+    Returns the number of posts unmarked; 0 for an unknown or already
+    undone batch.
+    """
+    with _connection(db_path, conn) as conn:
+        _roll_up_batch(conn, batch_id, sign=-1)
+        unmarked = conn.execute(
+            "UPDATE posts SET processed = 0, processed_at = NULL, processed_batch = NULL "
+            "WHERE processed_batch = ?",
+            (batch_id,),
+        ).rowcount
+        conn.execute(
+            "UPDATE processed_batches SET undone_at = ? WHERE id = ? AND undone_at IS NULL",
+            (datetime.now(timezone.utc).isoformat(), batch_id),
+        )
+    return unmarked
+
+
+def get_processed_batches(db_path=DEFAULT_DB_PATH, conn=None, limit=20):
+    """Return the most recent mark-processed batches, newest first."""
+    with _connection(db_path, conn) as conn:
+        return _query(
+            conn,
+            "SELECT id, marked_at, account, marked, undone_at FROM processed_batches "
+            "ORDER BY id DESC LIMIT ?",
+            (limit,),
+        )
+
+
+CLAIM_LIMIT = 50
+LEASE_SECONDS = 15 * 60
+
+
+def claim_posts(db_path=DEFAULT_DB_PATH, limit=CLAIM_LIMIT, lease_seconds=LEASE_SECONDS,
+                conn=None, account=None, now=None):
+    """Lease up to limit unprocessed posts to one worker, oldest first.
+
+    Posts under another worker's unexpired lease are skipped; expired
+    leases are back in the pool. The claim is one UPDATE, so concurrent
+    workers never get the same post; the leased posts are then read
+    back by lease id. Returns {"lease_id", "expires_at", "posts"};
+    finish with ack_lease or release_lease. Raises ValueError for a
+    limit below 1.
+    """
+    _check_limit(limit)
+    now = now or datetime.now(timezone.utc)
+    lease_id = uuid.uuid4().hex
+    expires_at = (now + timedelta(seconds=lease_seconds)).isoformat()
+    clauses, params = _account_clauses(account)
+    where = " AND ".join(
+        ["processed = 0", "(lease_expires_at IS NULL OR lease_expires_at <= ?)"] + clauses)
+    with _connection(db_path, conn) as conn:
+        conn.execute(
+            "UPDATE posts SET lease_id = ?, lease_expires_at = ? WHERE rowid IN "
+            f"(SELECT rowid FROM posts WHERE {where} ORDER BY rowid LIMIT ?)",
+            [lease_id, expires_at, now.isoformat()] + params + [limit],
+        )
+        posts = _query(
+            conn,
+            f"SELECT {UNPROCESSED_FIELDS} FROM {POSTS_WITH_AUTHORS} WHERE lease_id = ? "
+            f"ORDER BY posts.rowid",
+            (lease_id,),
+        )
+    return {"lease_id": lease_id, "expires_at": expires_at, "posts": posts}
+
+
+def ack_lease(db_path, lease_id, urls=None, conn=None):
+    """Mark a lease's posts (or only those in urls) processed, as one batch.
+
+    Only posts still held by the lease are marked: if it expired and
+    another worker claimed them, they are left to that worker.
+    Returns {"batch_id", "marked"} like mark_processed; the posts not
+    acknowledged stay leased until release_lease or expiry.
+    """
+    with _connection(db_path, conn) as conn:
+        if urls is None:
+            return _mark_batch(conn, None, "lease_id = ?", [lease_id])
+        return _mark_batch(conn, None, "lease_id = ? AND url IN (SELECT value FROM json_each(?))",
+                           [lease_id, json.dumps(list(urls))])
+
+
+def release_lease(db_path, lease_id, conn=None):
+    """Return a lease's remaining posts to the pool; returns how many."""
+    with _connection(db_path, conn) as conn:
+        return conn.execute(
+            "UPDATE posts SET lease_id = NULL, lease_expires_at = NULL "
+            "WHERE lease_id = ? AND processed = 0",
+            (lease_id,),
+        ).rowcount
+
+
+POSTED_DAY_SQL = "COALESCE(substr(posted_at, 1, 10), 'undated')"
+
+
+def _roll_up(conn, table, day_sql, counts, where, params):
+    """Add per-(day, account) counts over the posts matching where to a rollup.
+
+    counts maps rollup columns to aggregate expressions; day_sql gives
+    each post's day. One grouped INSERT ... ON CONFLICT, in the caller's
+    transaction.
+    """
+    columns = ", ".join(counts)
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in counts)
+    conn.execute(
+        f"INSERT INTO {table} (day, account, {columns}) "
+        f"SELECT {day_sql} AS day, account, {', '.join(counts.values())} FROM posts "
+        f"WHERE {where} GROUP BY day, account "
+        f"ON CONFLICT (day, account) DO UPDATE SET {updates}",
+        params,
+    )
+
+
+def rebuild_trends(db_path=DEFAULT_DB_PATH, conn=None):
+    """Recompute the daily rollups from posts and fetches.
+
+    Posts are read in one streaming pass and counted in memory per day,
+    so memory grows with the number of days, not posts. Posts marked
+    processed before processed_at was recorded count as marked on the
+    day they were fetched. Returns the number of posts counted.
+    """
+    post_days = {}
+    activity = {}
+
+    def bump(rollup, key, column, columns):
+        counts = rollup.setdefault(key, dict.fromkeys(columns, 0))
+        counts[column] += 1
+
+    post_columns = ("posts", "processed")
+    activity_columns = ("fetches", "fetched", "stored", "marked")
+    count = 0
+    with _connection(db_path, conn) as conn:
+        for account, posted_at, fetched_at, processed, processed_at in conn.execute(
+            "SELECT account, posted_at, fetched_at, processed, processed_at FROM posts"
+        ):
+            count += 1
+            day = posted_at[:10] if posted_at else "undated"
+            bump(post_days, (day, account), "posts", post_columns)
+            bump(activity, (fetched_at[:10], account), "stored", activity_columns)
+            if processed:
+                bump(post_days, (day, account), "processed", post_columns)
+                bump(activity, ((processed_at or fetched_at)[:10], account), "marked",
+                     activity_columns)
+        for day, account, fetches, fetched in conn.execute(
+            "SELECT substr(started_at, 1, 10) AS day, account, COUNT(*), SUM(fetched) "
+            "FROM fetches GROUP BY day, account"
+        ):
+            counts = activity.setdefault((day, account), dict.fromkeys(activity_columns, 0))
+            counts.update(fetches=fetches, fetched=fetched)
+        conn.execute("DELETE FROM daily_posts")
+        conn.execute("DELETE FROM daily_activity")
+        conn.executemany(
+            "INSERT INTO daily_posts (day, account, posts, processed) VALUES (?, ?, ?, ?)",
+            [key + tuple(counts.values()) for key, counts in post_days.items()],
+        )
+        conn.executemany(
+            "INSERT INTO daily_activity (day, account, fetches, fetched, stored, marked) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [key + tuple(counts.values()) for key, counts in activity.items()],
+        )
+    return count
+
+
+TRENDS_DAYS = 30
+
+
+def _trends_since(days):
+    """ISO date of the first day in a window of the last days days."""
+    return (datetime.now(timezone.utc) - timedelta(days=days - 1)).date().isoformat()
+
+
+def get_trends(db_path=DEFAULT_DB_PATH, since=None, account=None, conn=None):
+    """Return per-day feed trends from the rollup tables, oldest first.
+
+    Each day has posts and processed (by posted_at day), fetches,
+    fetched, stored and marked (by the day they happened), new_ratio
+    (stored / fetched) and backlog, the unprocessed count at the end of
+    that day. since is an ISO date; account limits to one account.
+    """
+    clauses, params = _account_clauses(account)
+    where = " AND ".join(["day != 'undated'", "day >= ?"] + clauses)
+    params = [since or ""] + params
+    with _connection(db_path, conn) as conn:
+        days = {}
+        for row in _query(conn, f"SELECT day, SUM(posts) AS posts, SUM(processed) AS processed "
+                                f"FROM daily_posts WHERE {where} GROUP BY day", params):
+            days[row["day"]] = row
+        for row in _query(conn, f"SELECT day, SUM(fetches) AS fetches, SUM(fetched) AS fetched, "
+                                f"SUM(stored) AS stored, SUM(marked) AS marked "
+                                f"FROM daily_activity WHERE {where} GROUP BY day", params):
+            days.setdefault(row["day"], {"day": row["day"]}).update(row)
+        before = " AND ".join(["day < ?"] + clauses)
+        backlog = conn.execute(
+            f"SELECT COALESCE(SUM(stored - marked), 0) FROM daily_activity WHERE {before}", params,
+        ).fetchone()[0]
+    trends = []
+    for day in sorted(days):
+        row = {"day": day}
+        row.update(dict.fromkeys(("posts", "processed", "fetches", "fetched", "stored", "marked"), 0))
+        row.update(days[day])
+        backlog += row["stored"] - row["marked"]
+        row["new_ratio"] = round(row["stored"] / row["fetched"], 3) if row["fetched"] else None
+        row["backlog"] = backlog
+        trends.append(row)
+    return trends
+
+
+def log_fetch(db_path, fetched, inserted, cutoff_offset=None, conn=None, telemetry=None,
+              account=DEFAULT_ACCOUNT):
+    """Record a fetch operation in the audit log and return its id.
+
+    cutoff_offset is the offset where an incremental fetch stopped paging.
+    telemetry is the stats dict filled in by fetch_feed_batched and
+    store_posts: api_ms, parse_ms and insert_ms go to fetch_phases, and
+    each entry of "batches" to fetch_batches.
+    """
+    started_at = datetime.now(timezone.utc).isoformat()
+    with _connection(db_path, conn) as conn:
+        fetch_id = conn.execute(
+            "INSERT INTO fetches (started_at, fetched, inserted, cutoff_offset, account) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (started_at, fetched, inserted, cutoff_offset, account),
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO daily_activity (day, account, fetches, fetched) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (day, account) DO UPDATE SET "
+            "fetches = fetches + 1, fetched = fetched + excluded.fetched",
+            (started_at[:10], account, fetched),
+        )
+        if telemetry:
+            conn.execute(
+                "INSERT INTO fetch_phases (fetch_id, api_ms, parse_ms, insert_ms) VALUES (?, ?, ?, ?)",
+                (fetch_id, telemetry.get("api_ms"), telemetry.get("parse_ms"),
+                 telemetry.get("insert_ms")),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO fetch_batches "
+                "(fetch_id, batch_offset, latency_ms, attempts, posts, error) VALUES (?, ?, ?, ?, ?, ?)",
+                [(fetch_id, b["offset"], b["latency_ms"], b["attempts"], b["posts"], b.get("error"))
+                 for b in telemetry.get("batches", ())],
+            )
+        return fetch_id
+
+
+def log_commit_time(db_path, fetch_id, commit_ms, conn=None):
+    """Record how long committing fetch_id's transaction took.
+
+    Written after the fact, since a commit can't time itself.
+    """
+    with _connection(db_path, conn) as conn:
+        conn.execute(
+            "INSERT INTO fetch_phases (fetch_id, commit_ms) VALUES (?, ?) "
+            "ON CONFLICT (fetch_id) DO UPDATE SET commit_ms = excluded.commit_ms",
+            (fetch_id, commit_ms),
+        )
+
+
+def get_fetch_log(db_path=DEFAULT_DB_PATH, conn=None):
+    """Return the fetch audit log, most recent first."""
+    with _connection(db_path, conn) as conn:
+        return _query(
+            conn,
+            "SELECT started_at, account, fetched, inserted, cutoff_offset FROM fetches "
+            "ORDER BY id DESC",
+        )
+
+
+STATS_PERCENTILES = (50, 95, 99)
+STATS_DAYS = 30
+STATS_SLOWEST = 5
+FETCH_PHASES = ("api_ms", "parse_ms", "insert_ms", "commit_ms")
+
+
+def _percentiles(values):
+    """Nearest-rank p50/p95/p99 of values, or None for each when empty."""
+    values = sorted(v for v in values if v is not None)
+    result = {}
+    for p in STATS_PERCENTILES:
+        result[f"p{p}"] = values[max(0, -(-p * len(values) // 100) - 1)] if values else None
+    return result
+
+
+def get_fetch_stats(db_path=DEFAULT_DB_PATH, days=STATS_DAYS, slowest=STATS_SLOWEST, conn=None):
+    """Summarize fetch telemetry from the last days days.
+
+    Returns the run count, p50/p95/p99 of per-batch API latency and of
+    each run phase, total retries, the per-day new/fetched ratio (oldest
+    first) and the slowest batches.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    with _connection(db_path, conn) as conn:
+        runs = conn.execute("SELECT COUNT(*) FROM fetches WHERE started_at >= ?", (since,)).fetchone()[0]
+        batches = conn.execute(
+            "SELECT b.latency_ms, b.attempts FROM fetch_batches b "
+            "JOIN fetches f ON f.id = b.fetch_id WHERE f.started_at >= ?",
+            (since,),
+        ).fetchall()
+        phases = conn.execute(
+            f"SELECT {', '.join(FETCH_PHASES)} FROM fetch_phases p "
+            "JOIN fetches f ON f.id = p.fetch_id WHERE f.started_at >= ?",
+            (since,),
+        ).fetchall()
+        daily = _query(
+            conn,
+            "SELECT substr(started_at, 1, 10) AS day, COUNT(*) AS runs, "
+            "SUM(fetched) AS fetched, SUM(inserted) AS inserted, "
+            "ROUND(CAST(SUM(inserted) AS REAL) / NULLIF(SUM(fetched), 0), 3) AS new_ratio "
+            "FROM fetches WHERE started_at >= ? GROUP BY day ORDER BY day",
+            (since,),
+        )
+        slowest_batches = _query(
+            conn,
+            "SELECT f.started_at, b.batch_offset AS offset, b.latency_ms, b.attempts, b.posts, b.error "
+            "FROM fetch_batches b JOIN fetches f ON f.id = b.fetch_id "
+            "WHERE f.started_at >= ? ORDER BY b.latency_ms DESC LIMIT ?",
+            (since, slowest),
+        )
+
+    return {
+        "runs": runs,
+        "batches": len(batches),
+        "retries": sum(attempts - 1 for _, attempts in batches if attempts > 1),
+        "batch_latency_ms": _percentiles(latency for latency, _ in batches),
+        "phases_ms": {
+            phase: _percentiles(row[i] for row in phases) for i, phase in enumerate(FETCH_PHASES)
+        },
+        "daily": daily,
+        "slowest_batches": slowest_batches,
+    }
+
+
+EXPORT_FORMATS = ("parquet", "ndjson.gz", "ndjson.zst")
+EXPORT_CHUNK_ROWS = 50000
+EXPORT_MANIFEST = "manifest.json"
+EXPORT_FIELDS = (
+    f"posts.id AS id, account, url, {AUTHOR_FIELDS}, content, posted_at, fetched_at, processed, "
+    "cluster_id, score"
+)
+
+
+def default_export_format():
+    """Parquet when pyarrow is installed, gzip-compressed NDJSON otherwise."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "ndjson.gz"
+    return "parquet"
+
+
+def _write_export_chunk(path, rows, export_format):
+    """Write rows to one chunk file and return its size in bytes.
+
+    pyarrow and zstandard are optional and only imported for their format.
+    """
+    if export_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ("id", pa.int64()), ("account", pa.string()), ("url", pa.string()),
+            ("author_name", pa.string()), ("author_profile", pa.string()),
+            ("content", pa.string()), ("posted_at", pa.string()), ("fetched_at", pa.string()),
+            ("processed", pa.int64()), ("cluster_id", pa.int64()), ("score", pa.float64()),
+        ])
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), path, compression="zstd")
+    elif export_format == "ndjson.zst":
+        import zstandard
+
+        with open(path, "wb") as raw, zstandard.ZstdCompressor().stream_writer(raw) as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+    else:
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return os.path.getsize(path)
+
+
+def _export_chunks(rows):
+    """Group rows (sorted by posted_at) into per-day chunks of bounded size."""
+    chunk, day = [], None
+    for row in rows:
+        row_day = row["posted_at"][:10] if row["posted_at"] else "undated"
+        if chunk and (row_day != day or len(chunk) >= EXPORT_CHUNK_ROWS):
+            yield day, chunk
+            chunk = []
+        chunk.append(row)
+        day = row_day
+    if chunk:
+        yield day, chunk
+
+
+def _write_export_manifest(conn, directory):
+    """Rewrite the manifest listing every chunk exported to directory."""
+    chunks = _query(
+        conn,
+        "SELECT c.file, c.day, c.rows, c.bytes, c.min_id, c.max_id, c.min_posted_at, "
+        "c.max_posted_at, e.format, e.id AS export_id FROM export_chunks c "
+        "JOIN exports e ON e.id = c.export_id WHERE e.directory = ? ORDER BY c.export_id, c.file",
+        (directory,),
+    )
+    manifest = {
+        "version": 1,
+        "watermark": max((chunk["max_id"] for chunk in chunks), default=0),
+        "chunks": chunks,
+    }
+    path = os.path.join(directory, EXPORT_MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def export_posts(db_path, directory, export_format=None, conn=None):
+    """Export the posts stored since the last export to directory.
+
+    The watermark is the highest post id exported to directory, kept in
+    the exports table, so each run reads and writes only new rows.
+    They are written in posted_at order as one chunk file per posted_at
+    day (split every EXPORT_CHUNK_ROWS rows), named after the export run.
+    manifest.json lists every chunk with its day, row count and id and
+    posted_at ranges, so readers can skip chunks they don't need. Later
+    changes to exported posts (e.g. processed) are not re-exported.
+    conn is committed before the manifest is rewritten, so the manifest
+    only lists chunks the database has recorded.
+    Returns {"export_id", "rows", "chunks", "bytes", "watermark"}.
+    """
+    export_format = export_format or default_export_format()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format!r}")
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    with _connection(db_path, conn) as conn:
+        cluster_posts(conn=conn)
+        watermark = conn.execute(
+            "SELECT COALESCE(MAX(watermark), 0) FROM exports WHERE directory = ?", (directory,),
+        ).fetchone()[0]
+        # The unary + keeps SQLite from walking the whole posted_at index
+        # for the ORDER BY; the rowid range plus a sort of new rows is cheaper.
+        rows = _iter_rows(
+            conn,
+            f"SELECT {EXPORT_FIELDS} FROM {POSTS_WITH_AUTHORS} WHERE posts.id > ? "
+            f"ORDER BY +posted_at, posts.id",
+            (watermark,),
+        )
+        export_id = conn.execute(
+            "INSERT INTO exports (directory, exported_at, format, watermark, rows, bytes) "
+            "VALUES (?, ?, ?, ?, 0, 0)",
+            (directory, datetime.now(timezone.utc).isoformat(), export_format, watermark),
+        ).lastrowid
+        chunks = []
+        for number, (day, chunk) in enumerate(_export_chunks(rows)):
+            name = f"{export_id:06d}-{day}-{number:04d}.{export_format}"
+            size = _write_export_chunk(os.path.join(directory, name), chunk, export_format)
+            dated = [row["posted_at"] for row in chunk if row["posted_at"]]
+            chunks.append((
+                export_id, name, day, len(chunk), size,
+                min(row["id"] for row in chunk), max(row["id"] for row in chunk),
+                min(dated, default=None), max(dated, default=None),
+            ))
+        if not chunks:
+            conn.execute("DELETE FROM exports WHERE id = ?", (export_id,))
+            return {"export_id": None, "rows": 0, "chunks": 0, "bytes": 0,
+                    "watermark": watermark}
+        conn.executemany(
+            "INSERT INTO export_chunks (export_id, file, day, rows, bytes, min_id, max_id, "
+            "min_posted_at, max_posted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            chunks,
+        )
+        summary = {
+            "export_id": export_id,
+            "rows": sum(chunk[3] for chunk in chunks),
+            "chunks": len(chunks),
+            "bytes": sum(chunk[4] for chunk in chunks),
+            "watermark": max(chunk[6] for chunk in chunks),
+        }
+        conn.execute(
+            "UPDATE exports SET watermark = ?, rows = ?, bytes = ? WHERE id = ?",
+            (summary["watermark"], summary["rows"], summary["bytes"], export_id),
+        )
+        conn.commit()
+        _write_export_manifest(conn, directory)
+    return summary
+
+
+CHARS_PER_TOKEN = 4
+DIGEST_CHUNK_TOKENS = 6000
+DIGEST_POST_TOKENS = 300
+DIGEST_FIELDS = ("url", "author_name", "content", "posted_at")
+
+
+def estimate_tokens(text):
+    """Rough token count for text (about CHARS_PER_TOKEN characters each)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _digest_post(post, post_tokens):
+    """Keep only DIGEST_FIELDS, with content whitespace-collapsed and truncated."""
+    slim = {field: post.get(field) for field in DIGEST_FIELDS}
+    content = " ".join((slim["content"] or "").split())
+    max_chars = post_tokens * CHARS_PER_TOKEN
+    if len(content) > max_chars:
+        content = content[:max_chars - 1].rstrip() + "…"
+    slim["content"] = content
+    return slim
+
+
+def _digest_chunk(posts, tokens):
+    urls = [p["url"] for p in posts]
+    chunk_id = hashlib.sha1("\n".join(urls).encode("utf-8")).hexdigest()[:12]
+    return {"id": chunk_id, "tokens": tokens, "urls": urls, "posts": posts}
+
+
+def build_digest(posts, chunk_tokens=DIGEST_CHUNK_TOKENS, post_tokens=DIGEST_POST_TOKENS):
+    """Group posts into chunks that each stay under chunk_tokens.
+
+    Yields dicts with id, tokens, urls and posts. The id is derived from
+    the member URLs, so the same backlog always produces the same chunks.
+    A single post larger than the budget gets a chunk of its own.
+    """
+    current = []
+    current_tokens = 0
+    for post in posts:
+        slim = _digest_post(post, post_tokens)
+        tokens = estimate_tokens(json.dumps(slim, ensure_ascii=False, separators=(",", ":")))
+        if current and current_tokens + tokens > chunk_tokens:
+            yield _digest_chunk(current, current_tokens)
+            current = []
+            current_tokens = 0
+        current.append(slim)
+        current_tokens += tokens
+    if current:
+        yield _digest_chunk(current, current_tokens)
+
+
+RETRY_DELAY = 3
+DEFAULT_CONCURRENCY = 1
+KNOWN_THRESHOLD = 0.8
+KNOWN_BATCHES = 1
+
+RATE_LIMIT = 2.0
+RATE_BURST = 4
+MAX_RETRIES = 3
+BACKOFF_MAX = 60.0
+BREAKER_THRESHOLD = 1
+BREAKER_COOLDOWN = 300.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+def _retry_after(exc):
+    """Seconds to wait suggested by an exception, if it carries a hint.
+
+    Looks for a retry_after attribute, then a Retry-After header on an
+    attached HTTP response (as requests' HTTPError has).
+    """
+    hint = getattr(exc, "retry_after", None)
+    if hint is None:
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        hint = headers.get("Retry-After")
+    try:
+        return max(0.0, float(hint)) if hint is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedCaller:
+    """Wrap a feed API callable with rate limiting, retries and a circuit breaker.
+
+    Calls are paced by a token bucket (rate per second, up to burst at
+    once). A failed call is retried up to max_retries times with
+    exponential backoff and jitter, or after the exception's Retry-After
+    hint when it is longer. The breaker counts calls that used up their
+    retries, not attempts, so transient errors in concurrent batches
+    can't add up to a trip. After breaker_threshold such calls in a row
+    the breaker opens and calls raise CircuitOpenError until
+    breaker_cooldown seconds pass; then one trial call is let through.
+
+    clock, sleep and rand are injectable so tests can run on a fake clock.
+    Safe to share between the threads of a concurrent fetch; last_attempts
+    is the number of attempts the current thread's latest call made.
+    """
+
+    def __init__(self, fn, rate=RATE_LIMIT, burst=RATE_BURST, max_retries=MAX_RETRIES,
+                 backoff_base=RETRY_DELAY, backoff_max=BACKOFF_MAX,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN,
+                 clock=time.monotonic, sleep=time.sleep, rand=random.random):
+        self.fn = fn
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.rand = rand
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def last_attempts(self):
+        return getattr(self.local, "attempts", 0)
+
+    def __call__(self, *args, **kwargs):
+        self.local.attempts = 0
+        for attempt in range(self.max_retries + 1):
+            self._check_breaker()
+            self._acquire()
+            self.local.attempts += 1
+            try:
+                result = self.fn(*args, **kwargs)
+            except Exception as exc:
+                if attempt == self.max_retries:
+                    self._record_failure()
+                    raise
+                delay = self._backoff(attempt)
+                hint = _retry_after(exc)
+                self.sleep(max(delay, hint) if hint is not None else delay)
+            else:
+                self._record_success()
+                return result
+
+    def _acquire(self):
+        """Take a token, sleeping until one is available."""
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def _backoff(self, attempt):
+        """Exponential backoff with equal jitter: half fixed, half random."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + self.rand() * delay / 2
+
+    def _check_breaker(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.clock() - self.opened_at < self.breaker_cooldown:
+                raise CircuitOpenError(
+                    f"Feed API paused after {self.failures} consecutive failed call(s)"
+                )
+            # half-open: let one trial call through; if it fails, re-open
+            self.opened_at = None
+            self.failures = self.breaker_threshold - 1
+
+    def _record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.breaker_threshold:
+                self.opened_at = self.clock()
+
+    def _record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_MAX_AGE_DAYS = 30
+
+
+class ResponseCache:
+    """On-disk record/replay cache of raw get_feed_posts batches.
+
+    Each recorded fetch is a run directory named by its UTC start time,
+    holding one gzip-compressed JSON file per batch with the offset,
+    limit, timestamp, latency and raw payload. Runs older than
+    max_age_days, then the oldest runs beyond max_bytes in total, are
+    evicted whenever a new recording starts.
+    """
+
+    def __init__(self, root, max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+
+    def runs(self):
+        """Recorded run ids, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def recorder(self, fn, run_id=None):
+        """Wrap fn so every successful batch is also written to a new run."""
+        run_id = run_id or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        run_dir = os.path.join(self.root, run_id)
+        os.makedirs(run_dir, exist_ok=True)
+        self.evict(keep=run_id)
+
+        def record(limit, offset, **kwargs):
+            started = time.monotonic()
+            payload = fn(limit=limit, offset=offset, **kwargs)
+            entry = {
+                "offset": offset,
+                "limit": limit,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "latency": time.monotonic() - started,
+                "payload": payload,
+            }
+            path = os.path.join(run_dir, f"{offset}-{limit}.json.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            return payload
+
+        record.run_id = run_id
+        return record
+
+    def replayer(self, run_id=None, simulate_latency=False, sleep=time.sleep):
+        """Return a get_feed_posts stand-in that serves a recorded run.
+
+        Defaults to the latest run. Offsets that were never recorded
+        return an empty batch, like an exhausted feed. With
+        simulate_latency, each batch takes as long as it did live.
+        """
+        runs = self.runs()
+        run_id = run_id or (runs[-1] if runs else None)
+        if run_id not in runs:
+            raise FileNotFoundError(f"No recorded run {run_id!r} in {self.root}")
+        run_dir = os.path.join(self.root, run_id)
+
+        def replay(limit, offset, **kwargs):
+            path = os.path.join(run_dir, f"{offset}-{limit}.json.gz")
+            if not os.path.exists(path):
+                return []
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+            if simulate_latency:
+                sleep(entry["latency"])
+            return entry["payload"]
+
+        replay.run_id = run_id
+        return replay
+
+    def evict(self, keep=None, now=None):
+        """Drop expired runs, then the oldest ones until under max_bytes."""
+        now = now or time.time()
+        sizes = {}
+        for run_id in self.runs():
+            run_dir = os.path.join(self.root, run_id)
+            paths = [os.path.join(run_dir, name) for name in os.listdir(run_dir)]
+            newest = max((os.path.getmtime(p) for p in paths), default=os.path.getmtime(run_dir))
+            if run_id != keep and now - newest > self.max_age_days * 86400:
+                shutil.rmtree(run_dir)
+                continue
+            sizes[run_id] = sum(os.path.getsize(p) for p in paths)
+        total = sum(sizes.values())
+        for run_id in sorted(sizes):
+            if total <= self.max_bytes:
+                break
+            if run_id == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, run_id))
+            total -= sizes[run_id]
+
+
+def _fetch_batch(get_feed_posts_fn, offset, retry_delay, retries=1, telemetry=None):
+    """Fetch one batch at offset, retrying up to retries times on failure.
+
+    With a telemetry dict, the batch's offset, wall-clock latency and API
+    attempts (including any the callable made itself) are written to it.
+    """
+    started = time.perf_counter()
+    attempts = 0
+    try:
+        for attempt in range(retries + 1):
+            try:
+                return get_feed_posts_fn(limit=BATCH_SIZE, offset=offset)
+            except CircuitOpenError:
+                raise
+            except Exception:
+                if attempt == retries:
+                    raise
+                time.sleep(retry_delay)
+            finally:
+                attempts += getattr(get_feed_posts_fn, "last_attempts", 1)
+    finally:
+        if telemetry is not None:
+            telemetry.update(offset=offset, latency_ms=_elapsed_ms(started), attempts=attempts)
+
+
+def fetch_feed_batched(get_feed_posts_fn, limit=DEFAULT_LIMIT, retry_delay=RETRY_DELAY,
+                       concurrency=DEFAULT_CONCURRENCY, known_urls_fn=None,
+                       known_threshold=KNOWN_THRESHOLD, known_batches=KNOWN_BATCHES,
+                       stats=None, retries=1):
+    """Fetch feed posts in batches of BATCH_SIZE.
+
+    Accepts a callable (e.g. api.get_feed_posts) to allow testing
+    without hitting the real API. Stops when the API returns zero posts.
+    Retries once per batch on failure (retries=0 when the callable already
+    retries, e.g. a RateLimitedCaller); returns partial results if retry fails.
+
+    With concurrency > 1, up to that many offsets are requested at once.
+    Batches are still merged in offset order, and anything after an empty
+    or failed batch is discarded, so the result matches a sequential fetch.
+
+    With known_urls_fn (urls -> set of already stored urls), paging stops
+    once known_batches consecutive batches are at least known_threshold
+    known posts. The stopping offset is written to stats["cutoff_offset"]
+    when a stats dict is passed.
+
+    A stats dict also receives the total fetch time as stats["api_ms"] and
+    one entry per merged batch in stats["batches"] (offset, latency_ms,
+    attempts, posts and error), ready for log_fetch.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    concurrency = max(1, concurrency)
+    all_posts = []
+    offset = 0
+    known_streak = 0
+    batches = []
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while len(all_posts) < limit:
+            remaining = -(-(limit - len(all_posts)) // BATCH_SIZE)
+            offsets = [offset + i * BATCH_SIZE for i in range(min(concurrency, remaining))]
+            records = [{"offset": o, "posts": 0, "error": None} for o in offsets]
+            futures = [
+                executor.submit(_fetch_batch, get_feed_posts_fn, o, retry_delay, retries, record)
+                for o, record in zip(offsets, records)
+            ]
+            done = False
+            for batch_offset, future, record in zip(offsets, futures, records):
+                try:
+                    batch = future.result()
+                except Exception as exc:
+                    record["error"] = str(exc) or type(exc).__name__
+                    batches.append(record)
+                    print(f"Batch at offset {batch_offset} failed after retry: {exc}",
+                          file=sys.stderr)
+                    done = True
+                    break
+                record["posts"] = len(batch or ())
+                batches.append(record)
+                if not batch:
+                    done = True
+                    break
+                all_posts.extend(batch)
+                if known_urls_fn is not None:
+                    known = known_urls_fn([p.get("url") for p in batch])
+                    if len(known) >= known_threshold * len(batch):
+                        known_streak += 1
+                    else:
+                        known_streak = 0
+                    if known_streak >= known_batches:
+                        if stats is not None:
+                            stats["cutoff_offset"] = batch_offset
+                        done = True
+                        break
+                if len(all_posts) >= limit:
+                    break
+            if done:
+                for future in futures:
+                    future.cancel()
+                break
+            offset = offsets[-1] + BATCH_SIZE
+
+    if stats is not None:
+        stats["api_ms"] = _elapsed_ms(started)
+        stats["batches"] = batches
+    return all_posts[:limit]
+
+
+def make_client(jsessionid, li_at):
+    """Return a Linkedin client authenticated with the browser's cookies.
+
+    linkedin_api (and requests under it) is imported here, on the fetch
+    path only, so the local-only commands start without the HTTP stack.
+    """
+    from linkedin_api import Linkedin
+    from requests.cookies import RequestsCookieJar
+
+    jar = RequestsCookieJar()
+    jsessionid = jsessionid.strip('"')
+    jar.set("JSESSIONID", f'"{jsessionid}"', domain=".linkedin.com")
+    jar.set("li_at", li_at, domain=".linkedin.com")
+    return Linkedin("", "", cookies=jar)
+
+
+def fetch_feed(jsessionid, li_at, limit=DEFAULT_LIMIT, rate_options=None, cache=None,
+               client=None, **batch_options):
+    """Authenticate via cookies and return feed posts in batches.
+
+    API calls go through a RateLimitedCaller built with rate_options.
+    With a ResponseCache, raw batches are recorded to a new run.
+    Pass client to reuse a make_client() client instead of authenticating.
+    Extra keyword arguments are passed through to fetch_feed_batched.
+    """
+    api = client or make_client(jsessionid, li_at)
+    get_feed_posts = api.get_feed_posts
+    if cache is not None:
+        get_feed_posts = cache.recorder(get_feed_posts)
+    get_feed_posts = RateLimitedCaller(get_feed_posts, **(rate_options or {}))
+    batch_options.setdefault("retries", 0)
+    return fetch_feed_batched(get_feed_posts, limit=limit, **batch_options)
+
+
+def record_fetch(db_path, posts, stats=None, conn=None, account=DEFAULT_ACCOUNT):
+    """Store fetched posts, log the run with its telemetry and commit.
+
+    This commits conn, together with anything already pending on it,
+    so each fetch is durable on its own. The commit's duration is then
+    written to fetch_phases with a second, short commit, so no write
+    transaction stays open while the caller waits on the network.
+    Returns a summary dict with fetched, inserted and cutoff_offset.
+    """
+    stats = stats if stats is not None else {}
+    with _connection(db_path, conn) as conn:
+        inserted = store_posts(db_path, posts, conn=conn, stats=stats, account=account)
+        fetch_id = log_fetch(db_path, fetched=len(posts), inserted=inserted,
+                             cutoff_offset=stats.get("cutoff_offset"), conn=conn,
+                             telemetry=stats, account=account)
+        started = time.perf_counter()
+        conn.commit()
+        log_commit_time(db_path, fetch_id, _elapsed_ms(started), conn=conn)
+        conn.commit()
+    return {"fetched": len(posts), "inserted": inserted, "cutoff_offset": stats.get("cutoff_offset")}
+
+
+ACCOUNT_RATE_OPTIONS = ("rate", "burst", "max_retries")
+
+
+def load_accounts(path):
+    """Read an accounts file: a JSON list of {"name", "jsessionid", "li_at"}.
+
+    An account may also set "rate", "burst" and "max_retries" for its own
+    rate limiter. Raises ValueError for a missing field or repeated name.
+    """
+    with open(path, encoding="utf-8") as f:
+        accounts = json.load(f)
+    if not isinstance(accounts, list):
+        raise ValueError(f"{path}: expected a JSON list of accounts")
+    names = set()
+    for account in accounts:
+        missing = [key for key in ("name", "jsessionid", "li_at") if not account.get(key)]
+        if missing:
+            raise ValueError(f"{path}: account {account.get('name', '?')!r} is missing "
+                             f"{', '.join(missing)}")
+        if account["name"] in names:
+            raise ValueError(f"{path}: account {account['name']!r} is listed twice")
+        names.add(account["name"])
+    return accounts
+
+
+def fetch_accounts(db_path, accounts, limit=DEFAULT_LIMIT, rate_options=None, incremental=False,
+                   conn=None, **batch_options):
+    """Fetch several accounts' feeds in parallel into one store.
+
+    Each account gets its own worker thread, client and RateLimitedCaller
+    (rate_options, overridden by the account's own settings). Workers only
+    call the API; with incremental, they check known URLs through their
+    own short-lived read connections. Posts are stored by the calling
+    thread, one account at a time as fetches finish, so there is a single
+    writer. Returns {name: summary} in the order accounts finished; a
+    failed account's summary holds its error instead.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    def fetch_one(account):
+        stats = {}
+        options = dict(batch_options, stats=stats)
+        if incremental:
+            options["known_urls_fn"] = lambda urls: get_known_urls(
+                db_path, urls, account=account["name"])
+        rate = dict(rate_options or {})
+        rate.update({key: account[key] for key in ACCOUNT_RATE_OPTIONS if key in account})
+        posts = fetch_feed(account["jsessionid"], account["li_at"], limit=limit,
+                           rate_options=rate, **options)
+        return posts, stats
+
+    summaries = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(accounts))) as executor:
+        futures = {executor.submit(fetch_one, account): account["name"] for account in accounts}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                posts, stats = future.result()
+            except Exception as exc:
+                summaries[name] = {"error": str(exc) or type(exc).__name__}
+                print(f"Fetch for account {name!r} failed: {summaries[name]['error']}",
+                      file=sys.stderr)
+                continue
+            summaries[name] = record_fetch(db_path, posts, stats, conn=conn, account=name)
+    return summaries
+
+
+DAEMON_INTERVAL = 8 * 60 * 60
+DAEMON_JITTER = 15 * 60
+
+
+class FetchDaemon:
+    """Run fetches on a fixed schedule against one warm connection.
+
+    fetch_fn(stats) returns the posts of one fetch, stored under account;
+    the caller builds it around a client and RateLimitedCaller that live
+    as long as the daemon, so there is no re-authentication between runs. Runs are
+    due every interval seconds from start, each delayed by up to jitter
+    seconds. A run that overruns the next slot makes that slot count as
+    skipped instead of starting straight after it. A failed run is
+    rolled back and recorded; the daemon keeps going. New posts are
+    clustered after each run, so collapsed reads find them ready.
+
+    The status file (JSON, replaced atomically) holds the state, counts,
+    last run and next due time. stop() is safe to use as a signal
+    handler: it ends the wait at once, or lets a running fetch finish.
+    clock, wait and rand are injectable for tests.
+    """
+
+    def __init__(self, db_path, fetch_fn, conn=None, interval=DAEMON_INTERVAL,
+                 jitter=DAEMON_JITTER, status_path=None, clock=time.time, wait=None,
+                 rand=random.uniform, account=DEFAULT_ACCOUNT):
+        self.db_path = db_path
+        self.account = account
+        self.fetch_fn = fetch_fn
+        self.conn = conn
+        self.interval = interval
+        self.jitter = jitter
+        self.status_path = status_path
+        self.clock = clock
+        self.stopping = threading.Event()
+        self.wait = wait or self.stopping.wait
+        self.rand = rand
+        self.status = {"pid": os.getpid(), "state": "starting", "runs": 0, "failures": 0,
+                       "skipped": 0, "last_run": None, "next_run_at": None}
+
+    def stop(self, *_):
+        self.stopping.set()
+
+    def run(self, max_runs=None):
+        """Fetch now, then on schedule until stop() (or after max_runs runs)."""
+        slot = self.clock()
+        due = slot
+        self.status["started_at"] = _isoformat(slot)
+        while not self.stopping.is_set():
+            self._write_status("waiting", next_run_at=due)
+            if self.wait(max(0.0, due - self.clock())) or self.stopping.is_set():
+                break
+            self.run_once()
+            if max_runs is not None and self.status["runs"] >= max_runs:
+                break
+            slot += self.interval
+            while slot <= self.clock():
+                self.status["skipped"] += 1
+                slot += self.interval
+            due = slot + self.rand(0, self.jitter)
+        self._write_status("stopped", next_run_at=None)
+
+    def run_once(self):
+        """Run one fetch and record it in the status; return the run entry."""
+        started = self.clock()
+        self._write_status("fetching")
+        run = {"started_at": _isoformat(started)}
+        try:
+            with _connection(self.db_path, self.conn) as conn:
+                stats = {}
+                posts = self.fetch_fn(stats)
+                run.update(record_fetch(self.db_path, posts, stats, conn=conn, account=self.account))
+                cluster_posts(conn=conn)
+                conn.commit()
+        except Exception as exc:
+            if self.conn is not None:
+                self.conn.rollback()
+            self.status["failures"] += 1
+            run["error"] = str(exc) or type(exc).__name__
+            print(f"Fetch failed: {run['error']}", file=sys.stderr)
+        run["seconds"] = round(self.clock() - started, 3)
+        self.status["runs"] += 1
+        self.status["last_run"] = run
+        return run
+
+    def _write_status(self, state, **fields):
+        self.status["state"] = state
+        for key, value in fields.items():
+            self.status[key] = _isoformat(value) if value is not None else None
+        if self.status_path is None:
+            return
+        tmp = f"{self.status_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.status, f, indent=2)
+        os.replace(tmp, self.status_path)
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_CACHE_ENTRIES = 128
+
+
+def _flag(params, name):
+    return params.get(name, "").lower() in ("1", "true", "yes")
+
+
+def _date_param(params, name):
+    return datetime.fromisoformat(params[name]) if params.get(name) else None
+
+
+def _paged(params):
+    return "limit" in params or "cursor" in params
+
+
+def _page_params(params):
+    return {"limit": int(params.get("limit", PAGE_SIZE)), "cursor": params.get("cursor") or None}
+
+
+class FeedService:
+    """The query and mark-processed commands as JSON endpoints on one connection.
+
+    handle() maps a request to (status, JSON body bytes). GET responses
+    are cached by path and query string, up to SERVE_CACHE_ENTRIES. The
+    cache is dropped after every write made through the service, and
+    whenever PRAGMA data_version shows another connection (a fetch, the
+    daemon) committed. The connection is opened on first use, so the
+    service belongs to the thread that serves it. scorer is used for
+    min_score queries; without one, the default angles file is loaded
+    on first use.
+    """
+
+    def __init__(self, db_path, conn=None, scorer=None):
+        self.db_path = db_path
+        self.conn = conn
+        self.owns_conn = conn is None
+        self.scorer = scorer
+        self.cache = {}
+        self.data_version = None
+        self.routes = {
+            ("GET", "/health"): self._health,
+            ("GET", "/unprocessed"): self._unprocessed,
+            ("GET", "/digest"): self._digest,
+            ("GET", "/posts"): self._posts,
+            ("GET", "/search"): self._search,
+            ("GET", "/authors"): self._authors,
+            ("GET", "/trends"): self._trends,
+            ("POST", "/mark-processed"): self._mark_processed,
+            ("POST", "/undo-processed"): self._undo_processed,
+            ("POST", "/claim"): self._claim,
+            ("POST", "/ack"): self._ack,
+            ("POST", "/release"): self._release,
+        }
+
+    def handle(self, method, path, params=None, body=b""):
+        """Return (status, body) for one request; params maps names to strings.
+
+        Bad input (ValueError, TypeError) is a 400 and a database error a
+        500; either way the request's changes are rolled back.
+        """
+        route = self.routes.get((method, path))
+        if route is None:
+            return 404, _json_body({"error": f"No endpoint {method} {path}"})
+        if self.conn is None:
+            self.conn = connect(self.db_path)
+        try:
+            if method == "GET":
+                result = self._cached(path, params or {}, route)
+            else:
+                payload = json.loads(body or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("Request body must be a JSON object")
+                result = _json_body(route(payload))
+        except (ValueError, TypeError) as exc:
+            self.conn.rollback()
+            return 400, _json_body({"error": str(exc)})
+        except sqlite3.Error as exc:
+            self.conn.rollback()
+            return 500, _json_body({"error": f"Database error: {exc}"})
+        else:
+            if method != "GET":
+                self.conn.commit()
+                self.cache.clear()
+            return 200, result
+
+    def close(self):
+        if self.owns_conn and self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _cached(self, path, params, route):
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.data_version:
+            self.cache.clear()
+            self.data_version = version
+        key = (path, tuple(sorted(params.items())))
+        if key not in self.cache:
+            result = route(params)
+            if self.conn.in_transaction:
+                self.conn.commit()
+            if len(self.cache) >= SERVE_CACHE_ENTRIES:
+                del self.cache[next(iter(self.cache))]
+            self.cache[key] = _json_body(result)
+        return self.cache[key]
+
+    def _health(self, params):
+        return {"ok": True, "unprocessed": count_unprocessed(
+            self.db_path, conn=self.conn, account=params.get("account"))}
+
+    def _unprocessed(self, params):
+        min_score = float(params["min_score"]) if params.get("min_score") else None
+        if min_score is not None:
+            if self.scorer is None:
+                self.scorer = load_scorer()
+            score_posts(self.db_path, self.scorer, conn=self.conn)
+        options = {"collapse": _flag(params, "collapse"), "min_score": min_score,
+                   "account": params.get("account")}
+        if _paged(params):
+            return get_unprocessed_page(self.db_path, conn=self.conn, **_page_params(params),
+                                        **options)
+        return get_unprocessed(self.db_path, conn=self.conn, **options)
+
+    def _digest(self, params):
+        return list(build_digest(
+            self._unprocessed(params),
+            chunk_tokens=int(params.get("chunk_tokens", DIGEST_CHUNK_TOKENS)),
+            post_tokens=int(params.get("post_tokens", DIGEST_POST_TOKENS)),
+        ))
+
+    def _posts(self, params):
+        options = {"after": _date_param(params, "after"), "before": _date_param(params, "before"),
+                   "collapse": _flag(params, "collapse"), "account": params.get("account")}
+        if _paged(params):
+            return get_posts_page(self.db_path, conn=self.conn, **_page_params(params), **options)
+        return get_posts(self.db_path, conn=self.conn, **options)
+
+    def _search(self, params):
+        if not params.get("q"):
+            raise ValueError("Missing search query parameter q")
+        processed = _flag(params, "processed") if "processed" in params else None
+        try:
+            return search_posts(self.db_path, params["q"], after=_date_param(params, "after"),
+                                before=_date_param(params, "before"), processed=processed,
+                                limit=int(params.get("limit", SEARCH_LIMIT)), conn=self.conn,
+                                account=params.get("account"))
+        except sqlite3.OperationalError as exc:
+            raise ValueError(f"Invalid search query: {exc}") from exc
+
+    def _authors(self, params):
+        return get_authors(self.db_path, limit=int(params.get("limit", AUTHORS_LIMIT)),
+                           conn=self.conn)
+
+    def _trends(self, params):
+        return get_trends(self.db_path, since=_trends_since(int(params.get("days", TRENDS_DAYS))),
+                          account=params.get("account"), conn=self.conn)
+
+    def _mark_processed(self, body):
+        account = body.get("account")
+        if body.get("all"):
+            return mark_all_processed(self.db_path, conn=self.conn, account=account)
+        urls = body.get("urls")
+        if not _string_list(urls):
+            raise ValueError('Send {"urls": [...]} or {"all": true}')
+        return mark_processed(self.db_path, urls, conn=self.conn,
+                              with_duplicates=bool(body.get("with_duplicates")), account=account)
+
+    def _undo_processed(self, body):
+        if not isinstance(body.get("batch_id"), int):
+            raise ValueError('Send {"batch_id": <id>}')
+        return {"unmarked": undo_processed(self.db_path, body["batch_id"], conn=self.conn)}
+
+    def _claim(self, body):
+        return claim_posts(self.db_path, limit=int(body.get("limit", CLAIM_LIMIT)),
+                           lease_seconds=float(body.get("lease_seconds", LEASE_SECONDS)),
+                           conn=self.conn, account=body.get("account"))
+
+    def _ack(self, body):
+        if not body.get("lease_id"):
+            raise ValueError('Send {"lease_id": "...", "urls": [...]}')
+        urls = body.get("urls")
+        if urls is not None and not _string_list(urls):
+            raise ValueError('"urls" must be a list of strings')
+        return ack_lease(self.db_path, body["lease_id"], urls=urls, conn=self.conn)
+
+    def _release(self, body):
+        if not body.get("lease_id"):
+            raise ValueError('Send {"lease_id": "..."}')
+        return {"released": release_lease(self.db_path, body["lease_id"], conn=self.conn)}
+
+
+def _string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _json_body(payload):
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def make_server(db_path, host=SERVE_HOST, port=SERVE_PORT, conn=None, scorer=None):
+    """Return an HTTPServer serving a FeedService; run it with serve_forever().
+
+    Requests are handled one at a time on the serving thread, which also
+    owns the connection (pass conn only when serving from its thread).
+    scorer is the FeedService's min_score scorer.
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qsl, urlsplit
+
+    service = FeedService(db_path, conn=conn, scorer=scorer)
+
+    class FeedRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            self._reply(*service.handle("GET", url.path, dict(parse_qsl(url.query))))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self._reply(*service.handle("POST", urlsplit(self.path).path, body=body))
+
+        def _reply(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), FeedRequestHandler)
+    server.service = service
+    return server
+
+
+OUTPUT_FORMATS = ("json", "ndjson")
+
+
+def _add_fetch_arguments(parser):
+    parser.add_argument(
+        "limit", nargs="?", type=int, default=DEFAULT_LIMIT,
+        help=f"Number of posts to fetch (default: {DEFAULT_LIMIT})",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help=f"Batches to request in parallel (default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Stop paging once batches are mostly already-stored posts",
+    )
+    parser.add_argument(
+        "--known-threshold", type=float, default=KNOWN_THRESHOLD,
+        help=f"Fraction of known posts that makes a batch 'known' (default: {KNOWN_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--known-batches", type=int, default=KNOWN_BATCHES,
+        help=f"Consecutive known batches before stopping (default: {KNOWN_BATCHES})",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=RATE_LIMIT,
+        help=f"Maximum API requests per second (default: {RATE_LIMIT})",
+    )
+    parser.add_argument(
+        "--max-retries", type=int, default=MAX_RETRIES,
+        help=f"Retries per request, with exponential backoff (default: {MAX_RETRIES})",
+    )
+    parser.add_argument(
+        "--account", help="Account name to store the posts under (default: unnamed)",
+    )
+
+
+def _add_account_argument(parser):
+    parser.add_argument("--account", help="Only this account's posts (default: all accounts)")
+
+
+def _positive_int(value):
+    import argparse
+
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def _add_page_arguments(parser):
+    parser.add_argument(
+        "--limit", type=_positive_int,
+        help=f"Return one page of at most this many posts (default with --cursor: {PAGE_SIZE})",
+    )
+    parser.add_argument("--cursor", help="Continue after the page that printed this cursor")
+
+
+def _print_marked(result):
+    batch = f" (batch {result['batch_id']})" if result["batch_id"] is not None else ""
+    print(f"Marked {result['marked']} post(s) as processed{batch}.")
+
+
+def _print_page(page_fn, args, db_path, conn, **options):
+    """Print one page: JSON with posts and next_cursor, or NDJSON plus the cursor on stderr."""
+    try:
+        page = page_fn(db_path, limit=args.limit or PAGE_SIZE, cursor=args.cursor, conn=conn,
+                       **options)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+    if args.format == "ndjson":
+        write_ndjson(page["posts"])
+        if page["next_cursor"]:
+            print(f"Next cursor: {page['next_cursor']}", file=sys.stderr)
+    else:
+        print(json.dumps(page, indent=2, ensure_ascii=False))
+
+
+def _add_score_arguments(parser):
+    parser.add_argument(
+        "--min-score", type=float,
+        help="Only posts whose local angle pre-score is at least this value",
+    )
+    parser.add_argument(
+        "--angles", default=DEFAULT_ANGLES_PATH,
+        help="Angles keyword/weight file used for --min-score (default: angles.json)",
+    )
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="LinkedIn feed tool")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = subparsers.add_parser("fetch", help="Fetch posts from LinkedIn")
+    _add_fetch_arguments(fetch_parser)
+    cache_group = fetch_parser.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--accounts", metavar="FILE",
+        help="Fetch every account in this JSON file in parallel (or only --account)",
+    )
+    cache_group.add_argument("--record", metavar="DIR", help="Record raw API batches to DIR")
+    cache_group.add_argument(
+        "--replay", metavar="DIR", help="Replay recorded batches from DIR instead of the API",
+    )
+    fetch_parser.add_argument("--run", help="Recorded run id to replay (default: latest)")
+    fetch_parser.add_argument(
+        "--simulate-latency", action="store_true", help="Replay with the recorded API latencies",
+    )
+
+    daemon_parser = subparsers.add_parser(
+        "daemon", help="Keep running and fetch on a schedule with a warm client and database",
+    )
+    _add_fetch_arguments(daemon_parser)
+    daemon_parser.add_argument(
+        "--interval", type=float, default=DAEMON_INTERVAL / 60,
+        help=f"Minutes between fetches (default: {DAEMON_INTERVAL // 60})",
+    )
+    daemon_parser.add_argument(
+        "--jitter", type=float, default=DAEMON_JITTER / 60,
+        help=f"Delay each fetch by up to this many random minutes (default: {DAEMON_JITTER // 60})",
+    )
+    daemon_parser.add_argument(
+        "--status-file", help="Status JSON path (default: next to the database)",
+    )
+    daemon_parser.add_argument(
+        "--replay", metavar="DIR", help="Replay recorded batches from DIR instead of the API",
+    )
+    daemon_parser.add_argument("--run", help="Recorded run id to replay (default: latest)")
+
+    unprocessed_parser = subparsers.add_parser("unprocessed", help="Show unprocessed posts as JSON")
+    unprocessed_parser.add_argument(
+        "--format", choices=OUTPUT_FORMATS, default="json",
+        help="json (one array) or ndjson (one post per line, streamed)",
+    )
+    unprocessed_parser.add_argument(
+        "--collapse", action="store_true", help="One post per near-duplicate cluster",
+    )
+    _add_score_arguments(unprocessed_parser)
+    _add_account_argument(unprocessed_parser)
+    _add_page_arguments(unprocessed_parser)
+
+    digest_parser = subparsers.add_parser(
+        "digest", help="Show unprocessed posts as token-budgeted chunks for the briefing",
+    )
+    digest_parser.add_argument(
+        "--chunk-tokens", type=int, default=DIGEST_CHUNK_TOKENS,
+        help=f"Token budget per chunk (default: {DIGEST_CHUNK_TOKENS})",
+    )
+    digest_parser.add_argument(
+        "--post-tokens", type=int, default=DIGEST_POST_TOKENS,
+        help=f"Truncate each post's content to this many tokens (default: {DIGEST_POST_TOKENS})",
+    )
+    digest_parser.add_argument(
+        "--format", choices=OUTPUT_FORMATS, default="json",
+        help="json (one array) or ndjson (one chunk per line, streamed)",
+    )
+    digest_parser.add_argument(
+        "--collapse", action="store_true", help="One post per near-duplicate cluster",
+    )
+    _add_score_arguments(digest_parser)
+    _add_account_argument(digest_parser)
+
+    search_parser = subparsers.add_parser("search", help="Full-text search posts as JSON")
+    search_parser.add_argument("query", help='FTS5 query, e.g. rails AND "ai agents"')
+    search_parser.add_argument("--after", help="Only posts after this date (ISO 8601)")
+    search_parser.add_argument("--before", help="Only posts before this date (ISO 8601)")
+    state_group = search_parser.add_mutually_exclusive_group()
+    state_group.add_argument("--processed", dest="processed", action="store_const", const=True,
+                             help="Only processed posts")
+    state_group.add_argument("--unprocessed", dest="processed", action="store_const", const=False,
+                             help="Only unprocessed posts")
+    search_parser.add_argument(
+        "--limit", type=int, default=SEARCH_LIMIT,
+        help=f"Maximum number of results (default: {SEARCH_LIMIT})",
+    )
+    _add_account_argument(search_parser)
+
+    subparsers.add_parser("rebuild-search", help="Rebuild the full-text search index")
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export posts stored since the last export as compressed chunk files",
+    )
+    export_parser.add_argument("directory", help="Export directory (holds manifest.json)")
+    export_parser.add_argument(
+        "--format", choices=EXPORT_FORMATS,
+        help="Chunk format (default: parquet if pyarrow is installed, else ndjson.gz)",
+    )
+
+    mark_parser = subparsers.add_parser("mark-processed", help="Mark posts as processed")
+    mark_parser.add_argument("urls", nargs="*", help="URLs to mark as processed")
+    mark_parser.add_argument(
+        "--all", action="store_true", help="Mark all unprocessed posts not leased to a worker",
+    )
+    mark_parser.add_argument(
+        "--with-duplicates", action="store_true",
+        help="Also mark near-duplicates of the given posts",
+    )
+    _add_account_argument(mark_parser)
+
+    undo_parser = subparsers.add_parser(
+        "undo-processed", help="Return a mark-processed batch to the backlog",
+    )
+    undo_parser.add_argument(
+        "batch_id", type=int, nargs="?", help="Batch to undo (omit to list recent batches)",
+    )
+
+    claim_parser = subparsers.add_parser(
+        "claim", help="Lease unprocessed posts to one worker and show them as JSON",
+    )
+    claim_parser.add_argument(
+        "limit", type=_positive_int, nargs="?", default=CLAIM_LIMIT,
+        help=f"Maximum number of posts to claim (default: {CLAIM_LIMIT})",
+    )
+    claim_parser.add_argument(
+        "--lease-seconds", type=float, default=LEASE_SECONDS,
+        help=f"Seconds until unacknowledged posts return to the pool (default: {LEASE_SECONDS})",
+    )
+    _add_account_argument(claim_parser)
+
+    ack_parser = subparsers.add_parser("ack", help="Mark a lease's posts as processed")
+    ack_parser.add_argument("lease_id", help="Lease id returned by claim")
+    ack_parser.add_argument("urls", nargs="*", help="Only these posts (default: the whole lease)")
+
+    release_parser = subparsers.add_parser(
+        "release", help="Return a lease's unacknowledged posts to the pool",
+    )
+    release_parser.add_argument("lease_id", help="Lease id returned by claim")
+
+    posts_parser = subparsers.add_parser("posts", help="Show posts filtered by date as JSON")
+    posts_parser.add_argument("--after", help="Only posts after this date (ISO 8601)")
+    posts_parser.add_argument("--before", help="Only posts before this date (ISO 8601)")
+    posts_parser.add_argument(
+        "--format", choices=OUTPUT_FORMATS, default="json",
+        help="json (one array) or ndjson (one post per line, streamed)",
+    )
+    posts_parser.add_argument(
+        "--collapse", action="store_true", help="One post per near-duplicate cluster",
+    )
+    _add_account_argument(posts_parser)
+    _add_page_arguments(posts_parser)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve the query and mark-processed commands as local JSON endpoints",
+    )
+    serve_parser.add_argument("--host", default=SERVE_HOST, help=f"Address to bind (default: {SERVE_HOST})")
+    serve_parser.add_argument(
+        "--port", type=int, default=SERVE_PORT, help=f"Port to listen on (default: {SERVE_PORT})",
+    )
+    serve_parser.add_argument(
+        "--angles", default=DEFAULT_ANGLES_PATH,
+        help="Angles keyword/weight file used for min_score (default: angles.json)",
+    )
+
+    trends_parser = subparsers.add_parser("trends", help="Show daily feed trends as JSON")
+    trends_parser.add_argument(
+        "--days", type=int, default=TRENDS_DAYS,
+        help=f"Only the last N days (default: {TRENDS_DAYS})",
+    )
+    _add_account_argument(trends_parser)
+
+    subparsers.add_parser("rebuild-trends", help="Recompute the daily trend rollups")
+
+    authors_parser = subparsers.add_parser(
+        "authors", help="Show authors by number of stored posts as JSON",
+    )
+    authors_parser.add_argument(
+        "--limit", type=int, default=AUTHORS_LIMIT,
+        help=f"Maximum number of authors (default: {AUTHORS_LIMIT})",
+    )
+
+    stats_parser = subparsers.add_parser("stats", help="Show fetch latency and yield stats as JSON")
+    stats_parser.add_argument(
+        "--days", type=int, default=STATS_DAYS,
+        help=f"Only fetches from the last N days (default: {STATS_DAYS})",
+    )
+    stats_parser.add_argument(
+        "--slowest", type=int, default=STATS_SLOWEST,
+        help=f"Number of slowest batches to list (default: {STATS_SLOWEST})",
+    )
+
+    args = parser.parse_args()
+    db_path = os.environ.get("LINKEDIN_DB_PATH", DEFAULT_DB_PATH)
+
+    with session(db_path) as conn:
+        init_db(db_path, conn=conn)
+        _run_command(args, db_path, conn)
+
+
+def _cookies_from_env():
+    """Return (jsessionid, li_at) from the environment, or exit with a hint."""
+    jsessionid = os.environ.get("LINKEDIN_JSESSIONID")
+    li_at = os.environ.get("LINKEDIN_LI_AT")
+
+    if not jsessionid or not li_at:
+        print(
+            "Set LINKEDIN_JSESSIONID and LINKEDIN_LI_AT environment variables.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    return jsessionid, li_at
+
+
+def _replayer(root, run_id=None, simulate_latency=False):
+    try:
+        return ResponseCache(root).replayer(run_id, simulate_latency=simulate_latency)
+    except FileNotFoundError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+
+
+def _batch_options(args, db_path, conn):
+    """fetch_feed_batched options shared by the fetch and daemon commands."""
+    options = {"concurrency": args.concurrency}
+    if args.incremental:
+        account = args.account or DEFAULT_ACCOUNT
+        options.update(
+            known_urls_fn=lambda urls: get_known_urls(db_path, urls, conn=conn, account=account),
+            known_threshold=args.known_threshold,
+            known_batches=args.known_batches,
+        )
+    return options
+
+
+def _run_command(args, db_path, conn):
+    """Dispatch a parsed CLI command against one shared connection."""
+    if args.command == "fetch" and args.accounts:
+        try:
+            accounts = load_accounts(args.accounts)
+        except (OSError, ValueError) as exc:
+            print(exc, file=sys.stderr)
+            sys.exit(1)
+        if args.account:
+            accounts = [a for a in accounts if a["name"] == args.account]
+            if not accounts:
+                print(f"No account {args.account!r} in {args.accounts}", file=sys.stderr)
+                sys.exit(1)
+        summaries = fetch_accounts(
+            db_path, accounts, limit=args.limit,
+            rate_options={"rate": args.rate, "max_retries": args.max_retries},
+            incremental=args.incremental, conn=conn, concurrency=args.concurrency,
+            known_threshold=args.known_threshold, known_batches=args.known_batches,
+        )
+        for account in accounts:
+            name = account["name"]
+            summary = summaries[name]
+            if "error" in summary:
+                print(f"{name}: failed ({summary['error']})")
+                continue
+            unprocessed = count_unprocessed(db_path, conn=conn, account=name)
+            print(f"{name}: fetched {summary['fetched']}, new {summary['inserted']}, "
+                  f"unprocessed {unprocessed}")
+        if any("error" in summary for summary in summaries.values()):
+            sys.exit(1)
+
+    elif args.command == "fetch":
+        stats = {}
+        account = args.account or DEFAULT_ACCOUNT
+        options = _batch_options(args, db_path, conn)
+        options["stats"] = stats
+
+        if args.replay:
+            replay = _replayer(args.replay, args.run, args.simulate_latency)
+            posts = fetch_feed_batched(replay, limit=args.limit, retries=0, **options)
+        else:
+            jsessionid, li_at = _cookies_from_env()
+            options["rate_options"] = {"rate": args.rate, "max_retries": args.max_retries}
+            if args.record:
+                options["cache"] = ResponseCache(args.record)
+            posts = fetch_feed(jsessionid, li_at, limit=args.limit, **options)
+
+        summary = record_fetch(db_path, posts, stats, conn=conn, account=account)
+        new_count = summary["inserted"]
+        cutoff_offset = summary["cutoff_offset"]
+        unprocessed = count_unprocessed(db_path, conn=conn, account=account)
+
+        print(f"Fetched:      {len(posts)}")
+        print(f"New:          {new_count}")
+        print(f"Unprocessed:  {unprocessed}")
+        if cutoff_offset is not None:
+            print(f"Stopped at:   offset {cutoff_offset} (reached stored posts)")
+
+    elif args.command == "daemon":
+        import signal
+
+        if args.replay:
+            get_feed_posts = _replayer(args.replay, args.run)
+        else:
+            client = make_client(*_cookies_from_env())
+            get_feed_posts = RateLimitedCaller(
+                client.get_feed_posts, rate=args.rate, max_retries=args.max_retries)
+        options = _batch_options(args, db_path, conn)
+        daemon = FetchDaemon(
+            db_path,
+            lambda stats: fetch_feed_batched(
+                get_feed_posts, limit=args.limit, retries=0, stats=stats, **options),
+            conn=conn,
+            interval=args.interval * 60,
+            jitter=args.jitter * 60,
+            status_path=args.status_file or f"{os.path.splitext(db_path)[0]}.status.json",
+            account=args.account or DEFAULT_ACCOUNT,
+        )
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        print(f"Fetching every {args.interval:g} minutes; status in {daemon.status_path}")
+        daemon.run()
+
+    elif args.command == "unprocessed":
+        if args.min_score is not None:
+            score_posts(db_path, load_scorer(args.angles), conn=conn)
+        options = {"collapse": args.collapse, "min_score": args.min_score,
+                   "account": args.account}
+        if args.limit is not None or args.cursor:
+            _print_page(get_unprocessed_page, args, db_path, conn, **options)
+        elif args.format == "ndjson":
+            write_ndjson(iter_unprocessed(db_path, conn=conn, **options))
+        else:
+            posts = get_unprocessed(db_path, conn=conn, **options)
+            print(json.dumps(posts, indent=2, ensure_ascii=False))
+
+    elif args.command == "digest":
+        if args.min_score is not None:
+            score_posts(db_path, load_scorer(args.angles), conn=conn)
+        chunks = build_digest(
+            iter_unprocessed(db_path, conn=conn, collapse=args.collapse, min_score=args.min_score,
+                             account=args.account),
+            chunk_tokens=args.chunk_tokens, post_tokens=args.post_tokens,
+        )
+        if args.format == "ndjson":
+            write_ndjson(chunks)
+        else:
+            print(json.dumps(list(chunks), indent=2, ensure_ascii=False))
+
+    elif args.command == "posts":
+        after = datetime.fromisoformat(args.after) if args.after else None
+        before = datetime.fromisoformat(args.before) if args.before else None
+        if args.limit is not None or args.cursor:
+            _print_page(get_posts_page, args, db_path, conn, after=after, before=before,
+                        collapse=args.collapse, account=args.account)
+        elif args.format == "ndjson":
+            write_ndjson(iter_posts(db_path, after=after, before=before, conn=conn,
+                                    collapse=args.collapse, account=args.account))
+        else:
+            posts = get_posts(db_path, after=after, before=before, conn=conn,
+                              collapse=args.collapse, account=args.account)
+            print(json.dumps(posts, indent=2, ensure_ascii=False))
+
+    elif args.command == "search":
+        after = datetime.fromisoformat(args.after) if args.after else None
+        before = datetime.fromisoformat(args.before) if args.before else None
+        try:
+            posts = search_posts(db_path, args.query, after=after, before=before,
+                                 processed=args.processed, limit=args.limit, conn=conn,
+                                 account=args.account)
+        except sqlite3.OperationalError as exc:
+            print(f"Invalid search query: {exc}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(posts, indent=2, ensure_ascii=False))
+
+    elif args.command == "serve":
+        import signal
+
+        server = make_server(db_path, args.host, args.port, conn=conn,
+                             scorer=load_scorer(args.angles))
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        host, port = server.server_address[:2]
+        print(f"Serving on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    elif args.command == "trends":
+        trends = get_trends(db_path, since=_trends_since(args.days), account=args.account,
+                            conn=conn)
+        print(json.dumps(trends, indent=2))
+
+    elif args.command == "rebuild-trends":
+        count = rebuild_trends(db_path, conn=conn)
+        print(f"Counted {count} post(s).")
+
+    elif args.command == "authors":
+        print(json.dumps(get_authors(db_path, limit=args.limit, conn=conn), indent=2,
+                         ensure_ascii=False))
+
+    elif args.command == "stats":
+        stats = get_fetch_stats(db_path, days=args.days, slowest=args.slowest, conn=conn)
+        print(json.dumps(stats, indent=2))
+
+    elif args.command == "rebuild-search":
+        count = rebuild_search_index(db_path, conn=conn)
+        print(f"Indexed {count} post(s).")
+
+    elif args.command == "export":
+        try:
+            summary = export_posts(db_path, args.directory, export_format=args.format, conn=conn)
+        except ImportError as exc:
+            print(f"The {args.format} format needs {exc.name}: pip install {exc.name}",
+                  file=sys.stderr)
+            sys.exit(1)
+        print(f"Exported {summary['rows']} post(s) in {summary['chunks']} chunk(s), "
+              f"{summary['bytes']} bytes (watermark {summary['watermark']}).")
+
+    elif args.command == "mark-processed":
+        if getattr(args, "all"):
+            result = mark_all_processed(db_path, conn=conn, account=args.account)
+        else:
+            result = mark_processed(db_path, args.urls, conn=conn,
+                                    with_duplicates=args.with_duplicates, account=args.account)
+        _print_marked(result)
+
+    elif args.command == "undo-processed":
+        if args.batch_id is None:
+            print(json.dumps(get_processed_batches(db_path, conn=conn), indent=2))
+        else:
+            count = undo_processed(db_path, args.batch_id, conn=conn)
+            print(f"Returned {count} post(s) to the backlog.")
+
+    elif args.command == "claim":
+        lease = claim_posts(db_path, limit=args.limit, lease_seconds=args.lease_seconds,
+                            conn=conn, account=args.account)
+        print(json.dumps(lease, indent=2, ensure_ascii=False))
+
+    elif args.command == "ack":
+        result = ack_lease(db_path, args.lease_id, urls=args.urls or None, conn=conn)
+        _print_marked(result)
+
+    elif args.command == "release":
+        count = release_lease(db_path, args.lease_id, conn=conn)
+        print(f"Released {count} post(s).")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+import json
+from datetime import datetime, timezone
+
+from bench_linkedin_feed import (
+    generate_feed, generate_old_strings, fake_feed, run_benchmarks, write_results, OLD_STRINGS,
+)
+from linkedin_feed import fetch_feed_batched, estimate_posted_at, estimate_posted_at_batch
+
+
+class TestGenerateFeed:
+    def test_posts_have_feed_shape(self):
+        posts = generate_feed(100)
+        assert len(posts) == 100
+        assert set(posts[0]) == {"url", "author_name", "author_profile", "content", "old"}
+        assert len({p["url"] for p in posts}) == 100
+        assert all(0 < len(p["content"]) <= 3000 for p in posts)
+
+    def test_is_deterministic_and_continues_ids(self):
+        assert generate_feed(10, seed=1) == generate_feed(10, seed=1)
+        first, second = generate_feed(10), generate_feed(10, start=10)
+        assert not {p["url"] for p in first} & {p["url"] for p in second}
+
+    def test_duplicate_rate(self):
+        posts = generate_feed(1000, duplicate_rate=0.3)
+        distinct = len({p["content"] for p in posts})
+        assert 600 < distinct < 800
+
+
+class TestGenerateOldStrings:
+    def test_draws_varied_ages(self):
+        olds = generate_old_strings(1000)
+        assert len(olds) == 1000
+        assert len(set(olds)) > 1
+        assert set(olds) <= set(OLD_STRINGS)
+        assert olds == generate_old_strings(1000)
+
+    def test_batch_parse_matches_per_item_on_varied_input(self):
+        fetched_at = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+        olds = generate_old_strings(2000)
+        assert estimate_posted_at_batch(olds, fetched_at) == [
+            estimate_posted_at(old, fetched_at) for old in olds
+        ]
+
+
+class TestFakeFeed:
+    def test_serves_posts_by_offset(self):
+        posts = generate_feed(120)
+        assert fetch_feed_batched(fake_feed(posts), limit=200) == posts
+
+
+class TestRunBenchmarks:
+    def test_small_run_writes_results(self, tmp_path):
+        results = run_benchmarks(sizes=[300], latency=0, parse_count=1000)
+        names = {r["name"] for r in results}
+        assert {"estimate_posted_at", "estimate_posted_at_batch", "store_posts_bulk", "store_posts_fetch",
+                "get_unprocessed", "get_posts_last_week", "mark_processed"} <= names
+        assert all(r["seconds"] >= 0 and r["peak_bytes"] > 0 for r in results)
+
+        output = tmp_path / "results.jsonl"
+        write_results(results, str(output))
+        write_results(results, str(output))
+        runs = [json.loads(line) for line in output.read_text().splitlines()]
+        assert len(runs) == 2
+        assert runs[0]["results"] == results
@@ -1,11 +1,29 @@
+import gzip
 import json
+import pytest
 import sqlite3
+import subprocess
 import sys
+import io
+import os
+import threading
+import time
+import urllib.request
+import urllib.error
+import tracemalloc
 from datetime import datetime, timezone, timedelta
 from linkedin_feed import (
     init_db, store_posts, get_unprocessed, mark_processed, estimate_posted_at,
-    log_fetch, get_fetch_log, fetch_feed, fetch_feed_batched, get_posts,
-    main, BATCH_SIZE, DEFAULT_LIMIT,
+    log_fetch, get_fetch_log, fetch_feed, fetch_feed_batched, get_posts, get_known_urls,
+    main, BATCH_SIZE, DEFAULT_LIMIT, estimate_posted_at_batch, connect, session, count_unprocessed, ingest_posts,
+    SCHEMA_VERSION, iter_unprocessed, iter_posts, write_ndjson, build_digest, estimate_tokens,
+    search_posts, rebuild_search_index, simhash, simhash_bands, hamming_distance, cluster_posts,
+    load_scorer, score_text, score_posts, RateLimitedCaller, CircuitOpenError, MAX_RETRIES,
+    ResponseCache, log_commit_time, get_fetch_stats, FetchDaemon, record_fetch,
+    FeedService, make_server, load_accounts, fetch_accounts, mark_all_processed, undo_processed,
+    get_processed_batches, claim_posts, ack_lease, release_lease,
+    get_unprocessed_page, get_posts_page, iter_pages, export_posts, get_authors,
+    get_trends, rebuild_trends,
 )
 
 
@@ -57,6 +75,32 @@ class TestEstimatePostedAt:
         result = estimate_posted_at("30s", now)
         assert result == datetime(2026, 2, 8, 11, 59, 30, tzinfo=timezone.utc)
 
+    def test_edited_prefix(self):
+        now = datetime(2026, 2, 8, 12, 0, 0, tzinfo=timezone.utc)
+        result = estimate_posted_at("Edited • 5h", now)
+        assert result == datetime(2026, 2, 8, 7, 0, 0, tzinfo=timezone.utc)
+
+    def test_spelled_out_and_localized_units(self):
+        now = datetime(2026, 2, 8, 12, 0, 0, tzinfo=timezone.utc)
+        three_hours = datetime(2026, 2, 8, 9, 0, 0, tzinfo=timezone.utc)
+        assert estimate_posted_at("3 hours", now) == three_hours
+        assert estimate_posted_at("3 Std.", now) == three_hours
+        assert estimate_posted_at("3 horas", now) == three_hours
+        assert estimate_posted_at("2 sem", now) == datetime(2026, 1, 25, 12, 0, 0, tzinfo=timezone.utc)
+        assert estimate_posted_at("1 year", now) == datetime(2025, 2, 8, 12, 0, 0, tzinfo=timezone.utc)
+        assert estimate_posted_at("5 jours", now) == datetime(2026, 2, 3, 12, 0, 0, tzinfo=timezone.utc)
+
+    def test_unknown_unit_returns_none(self):
+        now = datetime(2026, 2, 8, 12, 0, 0, tzinfo=timezone.utc)
+        assert estimate_posted_at("2nd", now) is None
+        assert estimate_posted_at("Promoted", now) is None
+
+    def test_batch_matches_single_calls(self):
+        now = datetime(2026, 2, 8, 12, 0, 0, tzinfo=timezone.utc)
+        olds = ["14m", "3h", "2d", "1w", "2 mo", "5h • Edited • 2nd", "Just now", "", None,
+                "None", "30s", "3h"]
+        assert estimate_posted_at_batch(olds, now) == [estimate_posted_at(o, now) for o in olds]
+
 
 class TestInitDb:
     def test_creates_posts_table(self, tmp_path):
@@ -70,6 +114,104 @@ class TestInitDb:
         assert "old" not in columns
 
 
+class TestMigrations:
+    def test_new_db_is_at_latest_version(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        conn = sqlite3.connect(db)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        conn.close()
+
+    def test_upgrades_unversioned_db_in_place(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        conn = sqlite3.connect(db)
+        conn.execute("CREATE TABLE posts (url TEXT PRIMARY KEY, author_name TEXT, "
+                     "author_profile TEXT, content TEXT, posted_at TEXT, "
+                     "fetched_at TEXT NOT NULL, processed INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("INSERT INTO posts (url, fetched_at) VALUES ('https://linkedin.com/post/1', 'x')")
+        conn.commit()
+        conn.close()
+
+        init_db(db)
+
+        conn = sqlite3.connect(db)
+        indexes = {r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'")}
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        conn.close()
+        assert {"idx_posts_unprocessed", "idx_posts_posted_at"} <= indexes
+        assert len(get_unprocessed(db)) == 1
+
+    def test_rerunning_is_a_no_op(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=2)
+        init_db(db)
+        assert count_unprocessed(db) == 2
+
+    def _plan(self, db, sql, params=()):
+        conn = sqlite3.connect(db)
+        plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        conn.close()
+        return plan
+
+    def test_unprocessed_query_uses_partial_index(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        plan = self._plan(db, "SELECT url FROM posts WHERE processed = 0 ORDER BY rowid")
+        assert "idx_posts_unprocessed" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_posted_at_query_uses_index(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        plan = self._plan(
+            db, "SELECT url FROM posts WHERE posted_at IS NOT NULL AND posted_at > ? "
+                "ORDER BY posted_at", ("2026-01-01",))
+        assert "idx_posts_posted_at" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+class TestSession:
+    def test_connect_applies_pragmas(self, tmp_path):
+        conn = connect(str(tmp_path / "test.db"))
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+        conn.close()
+
+    def test_shared_connection_commits_once_at_end(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        with session(db) as conn:
+            store_posts(db, [{"url": "https://linkedin.com/post/1", "old": "1h"}], conn=conn)
+            log_fetch(db, fetched=1, inserted=1, conn=conn)
+            assert count_unprocessed(db, conn=conn) == 1
+            # not visible to other connections until the session commits
+            assert count_unprocessed(db) == 0
+        assert count_unprocessed(db) == 1
+        assert len(get_fetch_log(db)) == 1
+
+    def test_session_rolls_back_on_error(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        try:
+            with session(db) as conn:
+                store_posts(db, [{"url": "https://linkedin.com/post/1", "old": "1h"}], conn=conn)
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        assert count_unprocessed(db) == 0
+
+    def test_readers_not_blocked_by_open_writer(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=2)
+        with session(db) as conn:
+            mark_processed(db, ["https://linkedin.com/feed/update/urn:li:activity:0"], conn=conn)
+            assert len(get_unprocessed(db)) == 2
+
+
 class TestStorePosts:
     def test_stores_new_posts(self, tmp_path):
         db = str(tmp_path / "test.db")
@@ -130,6 +272,49 @@ class TestStorePosts:
         assert count == 1
 
 
+class TestIngestPosts:
+    def test_returns_new_urls_in_feed_order(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=2)
+        posts = [
+            {"url": "https://linkedin.com/feed/update/urn:li:activity:9", "old": "1h"},
+            {"url": "https://linkedin.com/feed/update/urn:li:activity:1", "old": "1h"},
+            {"url": "https://linkedin.com/feed/update/urn:li:activity:5", "old": "1h"},
+        ]
+        new = ingest_posts(db, posts)
+        assert new == [
+            "https://linkedin.com/feed/update/urn:li:activity:9",
+            "https://linkedin.com/feed/update/urn:li:activity:5",
+        ]
+
+    def test_duplicates_within_batch_keep_first(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        posts = [
+            {"url": "https://linkedin.com/post/1", "content": "first", "old": "1h"},
+            {"url": "https://linkedin.com/post/1", "content": "second", "old": "1h"},
+        ]
+        assert store_posts(db, posts) == 1
+        assert get_unprocessed(db)[0]["content"] == "first"
+
+    def test_nothing_new_returns_empty_list(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=3)
+        assert ingest_posts(db, [{"url": u} for u in urls]) == []
+        assert ingest_posts(db, []) == []
+
+    def test_bulk_load(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        posts = [{"url": f"https://linkedin.com/post/{i}", "author_name": "A",
+                  "content": "x" * 200, "old": "2h"} for i in range(20000)]
+        assert store_posts(db, posts) == 20000
+        assert store_posts(db, posts) == 0
+        assert count_unprocessed(db) == 20000
+
+
 class TestGetUnprocessed:
     def test_returns_unprocessed_posts(self, tmp_path):
         db = str(tmp_path / "test.db")
@@ -186,9 +371,12 @@ def _seed_dated_posts(db):
         ("https://linkedin.com/post/4", "Dave", "", "No date",
          None, now_iso, 0),
     ]
+    store_posts(db, [{"url": url, "author_name": name, "author_profile": profile, "content": content}
+                     for url, name, profile, content, *_ in posts])
     conn.executemany(
-        "INSERT INTO posts (url, author_name, author_profile, content, posted_at, fetched_at, processed) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?)", posts,
+        "UPDATE posts SET posted_at = ?, fetched_at = ?, processed = ? WHERE url = ?",
+        [(posted_at, fetched_at, processed, url)
+         for url, _, _, _, posted_at, fetched_at, processed in posts],
     )
     conn.commit()
     conn.close()
@@ -286,6 +474,56 @@ class TestMarkProcessed:
         mark_processed(db, ["https://linkedin.com/feed/update/urn:li:activity:999"])
         # no error raised
 
+    def test_returns_exact_count_and_keeps_earlier_batch(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=3)
+        first = mark_processed(db, urls[:1])
+        second = mark_processed(db, urls + urls + ["https://linkedin.com/post/unknown"])
+        assert first == {"batch_id": 1, "marked": 1}
+        assert second == {"batch_id": 2, "marked": 2}
+        conn = sqlite3.connect(db)
+        batches = dict(conn.execute("SELECT url, processed_batch FROM posts"))
+        assert conn.execute("SELECT COUNT(*) FROM posts WHERE processed_at IS NULL").fetchone()[0] == 0
+        conn.close()
+        assert batches == {urls[0]: 1, urls[1]: 2, urls[2]: 2}
+
+    def test_no_batch_when_nothing_is_marked(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=2)
+        assert mark_processed(db, []) == {"batch_id": None, "marked": 0}
+        assert mark_processed(db, ["https://linkedin.com/post/unknown"]) == {
+            "batch_id": None, "marked": 0}
+        assert mark_processed(db, urls) == {"batch_id": 1, "marked": 2}
+        assert mark_all_processed(db) == {"batch_id": None, "marked": 0}
+        assert [b["id"] for b in get_processed_batches(db)] == [1]
+
+    def test_mark_all_and_undo(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=3)
+        mark_processed(db, urls[:1])
+        assert mark_all_processed(db) == {"batch_id": 2, "marked": 2}
+        assert undo_processed(db, 2) == 2
+        assert [p["url"] for p in get_unprocessed(db)] == urls[1:]
+        assert undo_processed(db, 2) == 0
+        [undone, kept] = get_processed_batches(db)
+        assert (undone["id"], undone["marked"]) == (2, 2)
+        assert undone["undone_at"] is not None
+        assert kept["undone_at"] is None
+
+    def test_mark_all_is_a_single_statement(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=5)
+        conn = connect(db)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        mark_all_processed(db, conn=conn)
+        conn.close()
+        assert len([s for s in statements if s.startswith("UPDATE posts")]) == 1
+
 
 class TestFetchAudit:
     def test_logs_a_fetch(self, tmp_path):
@@ -309,6 +547,26 @@ class TestFetchAudit:
         assert log[0]["inserted"] == 20
         assert log[1]["inserted"] == 100
 
+    def test_logs_cutoff_offset(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        log_fetch(db, fetched=100, inserted=3, cutoff_offset=50)
+        log_fetch(db, fetched=200, inserted=200)
+        log = get_fetch_log(db)
+        assert log[0]["cutoff_offset"] is None
+        assert log[1]["cutoff_offset"] == 50
+
+    def test_init_db_adds_cutoff_column_to_existing_db(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        conn = sqlite3.connect(db)
+        conn.execute("CREATE TABLE fetches (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                     "started_at TEXT NOT NULL, fetched INTEGER NOT NULL, inserted INTEGER NOT NULL)")
+        conn.commit()
+        conn.close()
+        init_db(db)
+        log_fetch(db, fetched=10, inserted=1, cutoff_offset=0)
+        assert get_fetch_log(db)[0]["cutoff_offset"] == 0
+
     def test_init_db_creates_fetches_table(self, tmp_path):
         db = str(tmp_path / "test.db")
         init_db(db)
@@ -418,6 +676,134 @@ class TestFetchFeedBatched:
         assert "server down" in err
 
 
+def _slow_feed(latency, calls, empty_from=None, fail_from=None):
+    """Build a fake get_feed_posts that sleeps and tracks concurrent calls."""
+    lock = threading.Lock()
+    in_flight = [0]
+
+    def fake_get_feed_posts(limit, offset, exclude_promoted_posts=True):
+        with lock:
+            in_flight[0] += 1
+            calls.append({"offset": offset, "in_flight": in_flight[0]})
+        try:
+            time.sleep(latency)
+            if fail_from is not None and offset >= fail_from:
+                raise ConnectionError("server down")
+            if empty_from is not None and offset >= empty_from:
+                return []
+            return [{"url": f"https://linkedin.com/feed/update/urn:li:activity:{offset + i}",
+                     "author_name": f"A{offset + i}", "author_profile": "",
+                     "content": f"P{offset + i}", "old": "1h"}
+                    for i in range(limit)]
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    return fake_get_feed_posts
+
+
+class TestFetchFeedConcurrent:
+    def test_results_merged_in_offset_order(self):
+        calls = []
+        fake = _slow_feed(0.05, calls)
+        posts = fetch_feed_batched(fake, limit=200, concurrency=4)
+        assert len(posts) == 200
+        ids = [int(p["url"].rsplit(":", 1)[1]) for p in posts]
+        assert ids == list(range(200))
+        assert sorted(c["offset"] for c in calls) == [0, 50, 100, 150]
+
+    def test_batches_overlap_in_time(self):
+        calls = []
+        fake = _slow_feed(0.1, calls)
+        start = time.monotonic()
+        fetch_feed_batched(fake, limit=200, concurrency=4)
+        elapsed = time.monotonic() - start
+        assert max(c["in_flight"] for c in calls) > 1
+        assert elapsed < 0.3
+
+    def test_concurrency_cap_is_respected(self):
+        calls = []
+        fake = _slow_feed(0.02, calls)
+        fetch_feed_batched(fake, limit=400, concurrency=2)
+        assert max(c["in_flight"] for c in calls) <= 2
+        assert len(calls) == 8
+
+    def test_stops_at_first_empty_batch(self):
+        calls = []
+        fake = _slow_feed(0.01, calls, empty_from=100)
+        posts = fetch_feed_batched(fake, limit=400, concurrency=4)
+        assert len(posts) == 100
+
+    def test_returns_partial_results_on_persistent_failure(self, capsys):
+        calls = []
+        fake = _slow_feed(0.01, calls, fail_from=100)
+        posts = fetch_feed_batched(fake, limit=400, retry_delay=0, concurrency=4)
+        assert len(posts) == 100
+        assert "offset 100" in capsys.readouterr().err
+
+
+class TestIncrementalFetch:
+    def _feed(self, calls):
+        def fake_get_feed_posts(limit, offset, exclude_promoted_posts=True):
+            calls.append(offset)
+            return [{"url": f"https://linkedin.com/feed/update/urn:li:activity:{offset + i}",
+                     "author_name": "A", "author_profile": "", "content": "P", "old": "1h"}
+                    for i in range(limit)]
+        return fake_get_feed_posts
+
+    def test_get_known_urls(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=2)
+        known = get_known_urls(db, urls + ["https://linkedin.com/feed/update/urn:li:activity:99"])
+        assert known == set(urls)
+
+    def test_stops_after_mostly_known_batch(self):
+        calls = []
+        known = {f"https://linkedin.com/feed/update/urn:li:activity:{i}" for i in range(50, 95)}
+        stats = {}
+        posts = fetch_feed_batched(
+            self._feed(calls), limit=200,
+            known_urls_fn=lambda urls: known & set(urls), stats=stats,
+        )
+        assert calls == [0, 50]
+        assert len(posts) == 100
+        assert stats["cutoff_offset"] == 50
+
+    def test_requires_consecutive_known_batches(self):
+        calls = []
+        known = {f"https://linkedin.com/feed/update/urn:li:activity:{i}"
+                 for i in list(range(0, 50)) + list(range(100, 200))}
+        stats = {}
+        fetch_feed_batched(
+            self._feed(calls), limit=400, known_batches=2,
+            known_urls_fn=lambda urls: known & set(urls), stats=stats,
+        )
+        # batch 0 known, batch 50 new resets the streak, 100 and 150 known
+        assert calls == [0, 50, 100, 150]
+        assert stats["cutoff_offset"] == 150
+
+    def test_no_cutoff_when_batches_are_new(self):
+        calls = []
+        stats = {}
+        posts = fetch_feed_batched(
+            self._feed(calls), limit=150, known_urls_fn=lambda urls: set(), stats=stats,
+        )
+        assert len(posts) == 150
+        assert "cutoff_offset" not in stats
+
+    def test_works_with_concurrency(self):
+        calls = []
+        known = {f"https://linkedin.com/feed/update/urn:li:activity:{i}" for i in range(400)}
+        stats = {}
+        posts = fetch_feed_batched(
+            self._feed(calls), limit=400, concurrency=4,
+            known_urls_fn=lambda urls: known & set(urls), stats=stats,
+        )
+        assert len(posts) == 50
+        assert stats["cutoff_offset"] == 0
+
+
 class TestFetchFeedCookies:
     def test_strips_existing_quotes_from_jsessionid(self, monkeypatch):
         """JSESSIONID must be wrapped in exactly one layer of quotes."""
@@ -426,9 +812,9 @@ class TestFetchFeedCookies:
         def fake_init(self, email, password, cookies=None):
             captured["cookies"] = cookies
 
-        monkeypatch.setattr("linkedin_feed.Linkedin.__init__", fake_init)
+        monkeypatch.setattr("linkedin_api.Linkedin.__init__", fake_init)
 
-        monkeypatch.setattr("linkedin_feed.fetch_feed_batched", lambda fn, limit: [])
+        monkeypatch.setattr("linkedin_feed.fetch_feed_batched", lambda fn, limit, **kwargs: [])
 
         # Value already has quotes (as it would from a .env file)
         fetch_feed('"ajax:123456"', "some-li-at", limit=1)
@@ -442,9 +828,9 @@ class TestFetchFeedCookies:
         def fake_init(self, email, password, cookies=None):
             captured["cookies"] = cookies
 
-        monkeypatch.setattr("linkedin_feed.Linkedin.__init__", fake_init)
+        monkeypatch.setattr("linkedin_api.Linkedin.__init__", fake_init)
 
-        monkeypatch.setattr("linkedin_feed.fetch_feed_batched", lambda fn, limit: [])
+        monkeypatch.setattr("linkedin_feed.fetch_feed_batched", lambda fn, limit, **kwargs: [])
 
         fetch_feed("ajax:123456", "some-li-at", limit=1)
         jsessionid_val = captured["cookies"]["JSESSIONID"]
@@ -569,3 +955,1575 @@ class TestPostsCLI:
         posts = json.loads(out)
         assert len(posts) == 1
         assert posts[0]["url"] == "https://linkedin.com/post/2"
+
+
+class TestNdjsonOutput:
+    def test_unprocessed_ndjson_one_object_per_line(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=3)
+
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "unprocessed", "--format", "ndjson"])
+        main()
+
+        lines = capsys.readouterr().out.splitlines()
+        assert [json.loads(line)["url"] for line in lines] == urls
+        assert all(": " not in line for line in lines)  # compact separators
+
+    def test_posts_ndjson_respects_filters(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_dated_posts(db)
+
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", [
+            "linkedin_feed.py", "posts", "--after", "2026-01-10", "--format", "ndjson",
+        ])
+        main()
+
+        lines = capsys.readouterr().out.splitlines()
+        assert [json.loads(line)["url"] for line in lines] == [
+            "https://linkedin.com/post/2", "https://linkedin.com/post/3",
+        ]
+
+    def test_iterators_are_lazy(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_dated_posts(db)
+        rows = iter_posts(db)
+        assert next(rows)["url"] == "https://linkedin.com/post/1"
+        rows.close()
+
+    def test_streaming_memory_stays_flat(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        store_posts(db, [{"url": f"https://linkedin.com/post/{i}", "content": "x" * 500, "old": "1h"}
+                         for i in range(20000)])
+
+        class NullWriter:
+            def write(self, text):
+                pass
+
+            def flush(self):
+                pass
+
+        tracemalloc.start()
+        write_ndjson(iter_unprocessed(db), out=NullWriter())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # the whole backlog is ~10MB of content; streaming holds one row at a time
+        assert peak < 1_000_000
+
+    def test_write_ndjson_to_buffer(self):
+        out = io.StringIO()
+        write_ndjson([{"a": 1}, {"b": "ż"}], out=out)
+        assert out.getvalue() == '{"a":1}\n{"b":"ż"}\n'
+
+
+class TestDigest:
+    def _posts(self, count, content="word " * 100):
+        return [{"url": f"https://linkedin.com/post/{i}", "author_name": f"A{i}",
+                 "author_profile": "https://linkedin.com/in/a", "content": content,
+                 "posted_at": "2026-02-08T10:00:00+00:00", "fetched_at": "x"}
+                for i in range(count)]
+
+    def test_estimate_tokens(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("abcde") == 2
+
+    def test_chunks_stay_under_budget(self):
+        chunks = list(build_digest(self._posts(50), chunk_tokens=1000))
+        assert len(chunks) > 1
+        assert all(c["tokens"] <= 1000 for c in chunks)
+        urls = [u for c in chunks for u in c["urls"]]
+        assert urls == [f"https://linkedin.com/post/{i}" for i in range(50)]
+
+    def test_drops_unneeded_fields_and_truncates(self):
+        [chunk] = build_digest(self._posts(1, content="x" * 5000), post_tokens=100)
+        post = chunk["posts"][0]
+        assert set(post) == {"url", "author_name", "content", "posted_at"}
+        assert len(post["content"]) == 400
+        assert post["content"].endswith("…")
+
+    def test_chunk_ids_are_stable(self):
+        first = [c["id"] for c in build_digest(self._posts(30), chunk_tokens=800)]
+        second = [c["id"] for c in build_digest(self._posts(30), chunk_tokens=800)]
+        assert first == second
+        assert len(set(first)) == len(first)
+
+    def test_oversized_post_gets_own_chunk(self):
+        chunks = list(build_digest(self._posts(3, content="x" * 4000),
+                                   chunk_tokens=100, post_tokens=1000))
+        assert [len(c["posts"]) for c in chunks] == [1, 1, 1]
+
+    def test_digest_cli(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=5)
+
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "digest", "--format", "ndjson"])
+        main()
+
+        chunks = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert len(chunks) == 1
+        assert chunks[0]["urls"] == urls
+
+
+def _seed_search_posts(db):
+    store_posts(db, [
+        {"url": "https://linkedin.com/post/1", "author_name": "Alice",
+         "content": "Shipping Rails apps with Kamal and AI agents", "old": "1d"},
+        {"url": "https://linkedin.com/post/2", "author_name": "Bob",
+         "content": "Hiring lessons from ten years as a CTO", "old": "2d"},
+        {"url": "https://linkedin.com/post/3", "author_name": "Carol",
+         "content": "Rails, Rails, Rails: why Rails still wins for AI products", "old": "3w"},
+    ])
+
+
+class TestSearch:
+    def test_ranks_best_match_first(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        results = search_posts(db, "rails")
+        assert [r["url"] for r in results] == [
+            "https://linkedin.com/post/3", "https://linkedin.com/post/1",
+        ]
+        assert results[0]["rank"] <= results[1]["rank"]
+
+    def test_matches_author_name(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        assert [r["url"] for r in search_posts(db, "bob")] == ["https://linkedin.com/post/2"]
+
+    def test_date_bounds(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        after = datetime.now(timezone.utc) - timedelta(days=7)
+        assert [r["url"] for r in search_posts(db, "rails", after=after)] == [
+            "https://linkedin.com/post/1",
+        ]
+
+    def test_processed_filter(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        mark_processed(db, ["https://linkedin.com/post/3"])
+        assert [r["url"] for r in search_posts(db, "rails", processed=False)] == [
+            "https://linkedin.com/post/1",
+        ]
+        assert [r["url"] for r in search_posts(db, "rails", processed=True)] == [
+            "https://linkedin.com/post/3",
+        ]
+
+    def test_rebuild_indexes_existing_rows(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        conn = sqlite3.connect(db)
+        conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('delete-all')")
+        conn.commit()
+        conn.close()
+        assert search_posts(db, "kamal") == []
+        assert rebuild_search_index(db) == 3
+        assert len(search_posts(db, "kamal")) == 1
+
+    def test_search_cli(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "search", "cto", "--unprocessed"])
+        main()
+
+        posts = json.loads(capsys.readouterr().out)
+        assert [p["url"] for p in posts] == ["https://linkedin.com/post/2"]
+
+
+ANNOUNCEMENT = (
+    "We are thrilled to announce that our team just shipped the new Rails 8 "
+    "deployment guide with Kamal, covering zero downtime deploys, secrets, "
+    "accessories and how we moved forty services off Heroku in two weeks"
+)
+
+
+class TestNearDuplicates:
+    def test_simhash_is_stable_and_close_for_small_edits(self):
+        a = simhash(ANNOUNCEMENT)
+        assert a == simhash(ANNOUNCEMENT)
+        assert hamming_distance(a, simhash(ANNOUNCEMENT + " #rails")) <= 3
+        assert hamming_distance(a, simhash("Hiring a senior Go engineer in Berlin, DM me")) > 3
+        assert simhash("") is None
+
+    def test_close_hashes_share_a_band(self):
+        a = simhash(ANNOUNCEMENT)
+        b = a ^ 0b1011  # three bits apart
+        assert set(simhash_bands(a)) & set(simhash_bands(b))
+
+    def test_reshares_land_in_one_cluster(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        store_posts(db, [
+            {"url": "https://linkedin.com/post/1", "author_name": "Alice", "content": ANNOUNCEMENT},
+            {"url": "https://linkedin.com/post/2", "author_name": "Bob", "content": "Unrelated hot take"},
+            {"url": "https://linkedin.com/post/3", "author_name": "Carol",
+             "content": ANNOUNCEMENT + " #rails"},
+        ])
+        assert cluster_posts(db) == 3
+        store_posts(db, [
+            {"url": "https://linkedin.com/post/4", "author_name": "Dave", "content": ANNOUNCEMENT},
+        ])
+        assert cluster_posts(db) == 1
+        assert cluster_posts(db) == 0
+        conn = sqlite3.connect(db)
+        clusters = dict(conn.execute("SELECT url, cluster_id FROM posts"))
+        conn.close()
+        assert (clusters["https://linkedin.com/post/1"] == clusters["https://linkedin.com/post/3"]
+                == clusters["https://linkedin.com/post/4"])
+        assert clusters["https://linkedin.com/post/2"] != clusters["https://linkedin.com/post/1"]
+
+    def test_ingest_defers_clustering(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        store_posts(db, [
+            {"url": f"https://linkedin.com/post/{i}", "content": ANNOUNCEMENT + " #rails" * (i % 2)}
+            for i in range(5)
+        ])
+        conn = sqlite3.connect(db)
+        assert conn.execute("SELECT COUNT(*) FROM posts WHERE cluster_id IS NULL").fetchone()[0] == 5
+        conn.close()
+        assert cluster_posts(db) == 5
+        conn = sqlite3.connect(db)
+        assert conn.execute("SELECT COUNT(DISTINCT cluster_id) FROM posts").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM simhashes").fetchone()[0] == 2
+        conn.close()
+
+    def test_collapse_returns_one_post_per_cluster(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        store_posts(db, [
+            {"url": "https://linkedin.com/post/1", "content": ANNOUNCEMENT, "old": "1h"},
+            {"url": "https://linkedin.com/post/2", "content": "Unrelated hot take", "old": "1h"},
+            {"url": "https://linkedin.com/post/3", "content": ANNOUNCEMENT, "old": "1h"},
+        ])
+        assert len(get_unprocessed(db)) == 3
+        assert [p["url"] for p in get_unprocessed(db, collapse=True)] == [
+            "https://linkedin.com/post/1", "https://linkedin.com/post/2",
+        ]
+        assert len(get_posts(db, collapse=True)) == 2
+
+    def test_mark_processed_with_duplicates(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        store_posts(db, [
+            {"url": "https://linkedin.com/post/1", "content": ANNOUNCEMENT},
+            {"url": "https://linkedin.com/post/2", "content": "Unrelated hot take"},
+            {"url": "https://linkedin.com/post/3", "content": ANNOUNCEMENT},
+        ])
+        mark_processed(db, ["https://linkedin.com/post/1"], with_duplicates=True)
+        assert [p["url"] for p in get_unprocessed(db)] == ["https://linkedin.com/post/2"]
+
+    def test_candidate_lookup_uses_band_index(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        conn = sqlite3.connect(db)
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT s.simhash, s.cluster_id FROM simhash_bands b "
+            "JOIN simhashes s ON s.simhash = b.simhash WHERE b.key IN (?, ?, ?, ?)", (1, 2, 3, 4)))
+        conn.close()
+        assert "SCAN" not in plan
+
+
+def _write_angles(tmp_path, bonus=1.0):
+    path = tmp_path / "angles.json"
+    path.write_text(json.dumps({
+        "multi_angle_bonus": bonus,
+        "angles": {
+            "rails": {"weight": 2.0, "keywords": {"rails": 1, "ruby on rails": 1, "kamal": 1}},
+            "ai": {"weight": 1.0, "keywords": {"claude code": 2, "llm": 1}},
+        },
+    }))
+    return str(path)
+
+
+class TestPreScoring:
+    def test_scores_distinct_keywords_per_angle(self, tmp_path):
+        scorer = load_scorer(_write_angles(tmp_path))
+        assert score_text(scorer, "Deploying Rails with Kamal, more Rails") == 4.0
+        assert score_text(scorer, "Nothing relevant here") == 0
+
+    def test_multi_angle_bonus(self, tmp_path):
+        scorer = load_scorer(_write_angles(tmp_path, bonus=1.5))
+        # rails 2.0 + claude code 2.0 + bonus for the second angle
+        assert score_text(scorer, "Rails apps written with Claude Code") == 5.5
+
+    def test_matches_whole_words_case_insensitively(self, tmp_path):
+        scorer = load_scorer(_write_angles(tmp_path))
+        assert score_text(scorer, "LLM tips") == 1.0
+        assert score_text(scorer, "guardrails and llmops") == 0
+
+    def test_default_angles_file_loads(self):
+        scorer = load_scorer()
+        assert score_text(scorer, "AI agents in Ruby on Rails with Claude Code") > \
+            score_text(scorer, "Happy Friday everyone")
+
+    def test_scores_are_cached_per_version(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        scorer = load_scorer(_write_angles(tmp_path))
+        assert score_posts(db, scorer) == 3
+        assert score_posts(db, scorer) == 0
+        store_posts(db, [{"url": "https://linkedin.com/post/9", "content": "LLM"}])
+        assert score_posts(db, scorer) == 1
+        assert score_posts(db, load_scorer(_write_angles(tmp_path, bonus=3.0))) == 4
+
+    def test_min_score_filters_unprocessed(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        score_posts(db, load_scorer(_write_angles(tmp_path)))
+        urls = [p["url"] for p in get_unprocessed(db, min_score=2.0)]
+        assert urls == ["https://linkedin.com/post/1", "https://linkedin.com/post/3"]
+
+    def test_min_score_cli(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", [
+            "linkedin_feed.py", "unprocessed", "--min-score", "4",
+            "--angles", _write_angles(tmp_path),
+        ])
+        main()
+
+        posts = json.loads(capsys.readouterr().out)
+        assert [p["url"] for p in posts] == ["https://linkedin.com/post/1"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.retry_after = retry_after
+
+
+def _flaky(failures, exc=ConnectionError("blip")):
+    calls = []
+
+    def fn(**kwargs):
+        calls.append(kwargs)
+        if len(calls) <= failures:
+            raise exc
+        return ["ok"]
+
+    return fn, calls
+
+
+class TestRateLimitedCaller:
+    def _caller(self, fn, clock, **kwargs):
+        options = {"rate": 1.0, "burst": 2, "max_retries": 3, "backoff_base": 1.0,
+                   "clock": clock, "sleep": clock.sleep, "rand": lambda: 0.0}
+        options.update(kwargs)
+        return RateLimitedCaller(fn, **options)
+
+    def test_token_bucket_paces_calls(self):
+        clock = FakeClock()
+        fn, calls = _flaky(0)
+        caller = self._caller(fn, clock)
+        for _ in range(5):
+            caller(limit=50, offset=0)
+        # burst of 2 is free, then one call per second
+        assert clock.now == 3.0
+
+    def test_exponential_backoff_with_jitter(self):
+        clock = FakeClock()
+        fn, calls = _flaky(3)
+        caller = self._caller(fn, clock, rate=1000.0, rand=lambda: 1.0)
+        assert caller(limit=50, offset=0) == ["ok"]
+        assert len(calls) == 4
+        assert clock.sleeps == [1.0, 2.0, 4.0]
+
+    def test_jitter_halves_the_minimum_delay(self):
+        clock = FakeClock()
+        fn, _ = _flaky(2)
+        caller = self._caller(fn, clock, rate=1000.0, rand=lambda: 0.0)
+        caller(limit=50, offset=0)
+        assert clock.sleeps == [0.5, 1.0]
+
+    def test_honors_retry_after_hint(self):
+        clock = FakeClock()
+        fn, _ = _flaky(1, exc=Throttled(retry_after=30))
+        caller = self._caller(fn, clock, rate=1000.0)
+        caller(limit=50, offset=0)
+        assert clock.sleeps == [30.0]
+
+    def test_gives_up_after_retry_budget(self):
+        clock = FakeClock()
+        fn, calls = _flaky(10)
+        caller = self._caller(fn, clock, rate=1000.0, max_retries=2, breaker_threshold=100)
+        try:
+            caller(limit=50, offset=0)
+            assert False, "expected failure"
+        except ConnectionError:
+            pass
+        assert len(calls) == 3
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        clock = FakeClock()
+        fn, calls = _flaky(3)
+        caller = self._caller(fn, clock, rate=1000.0, max_retries=0,
+                              breaker_threshold=3, breaker_cooldown=60)
+        for _ in range(3):
+            try:
+                caller(limit=50, offset=0)
+            except ConnectionError:
+                pass
+        try:
+            caller(limit=50, offset=0)
+            assert False, "expected open circuit"
+        except CircuitOpenError:
+            pass
+        assert len(calls) == 3
+        clock.now += 61
+        assert caller(limit=50, offset=0) == ["ok"]
+
+    def test_fetch_feed_batched_stops_on_open_circuit(self, capsys):
+        clock = FakeClock()
+
+        def always_down(limit, offset, exclude_promoted_posts=True):
+            raise ConnectionError("server down")
+
+        caller = self._caller(always_down, clock, rate=1000.0, max_retries=1,
+                              breaker_threshold=2)
+        posts = fetch_feed_batched(caller, limit=200, retry_delay=0, retries=0)
+        assert posts == []
+        assert "server down" in capsys.readouterr().err
+
+    def test_transient_errors_in_concurrent_batches_dont_trip_the_breaker(self):
+        clock = FakeClock()
+        feed = _feed_fn(200)
+        failed = set()
+        lock = threading.Lock()
+        backoffs = threading.Barrier(4, timeout=5)
+
+        def first_call_per_offset_fails(limit, offset, exclude_promoted_posts=True):
+            with lock:
+                first = offset not in failed
+                failed.add(offset)
+            if first:
+                raise Throttled()
+            return feed(limit=limit, offset=offset)
+
+        def sleep(seconds):
+            if len(clock.sleeps) < 4:
+                backoffs.wait()  # all four batches have failed once before any retries
+            clock.sleep(seconds)
+
+        caller = self._caller(first_call_per_offset_fails, clock, rate=1000.0, burst=8,
+                              sleep=sleep)
+        posts = fetch_feed_batched(caller, limit=200, concurrency=4, retries=0)
+        assert len(posts) == 200
+        assert caller.opened_at is None
+
+    def test_breaker_trips_within_one_fetch_feed_call(self):
+        clock = FakeClock()
+        calls = []
+
+        class DownClient:
+            def get_feed_posts(self, limit, offset, exclude_promoted_posts=True):
+                calls.append(offset)
+                raise ConnectionError("server down")
+
+        stats = {}
+        posts = fetch_feed(None, None, limit=200, client=DownClient(), retries=1, retry_delay=0,
+                           stats=stats, rate_options={"rate": 1000.0, "clock": clock,
+                                                      "sleep": clock.sleep, "rand": lambda: 0.0})
+        assert posts == []
+        assert calls == [0] * (MAX_RETRIES + 1)
+        assert "paused" in stats["batches"][0]["error"]
+
+
+def _feed_fn(total):
+    def fake_get_feed_posts(limit, offset, exclude_promoted_posts=True):
+        return [{"url": f"https://linkedin.com/feed/update/urn:li:activity:{i}",
+                 "author_name": "A", "author_profile": "", "content": f"P{i}", "old": "1h"}
+                for i in range(offset, min(offset + limit, total))]
+    return fake_get_feed_posts
+
+
+class TestResponseCache:
+    def test_records_and_replays_a_run(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache"))
+        recorder = cache.recorder(_feed_fn(120), run_id="run1")
+        live = fetch_feed_batched(recorder, limit=200)
+        assert len(live) == 120
+        assert sorted(os.listdir(tmp_path / "cache" / "run1")) == [
+            "0-50.json.gz", "100-50.json.gz", "150-50.json.gz", "50-50.json.gz",
+        ]
+        replayed = fetch_feed_batched(cache.replayer("run1"), limit=200)
+        assert replayed == live
+
+    def test_replays_latest_run_by_default(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache"))
+        fetch_feed_batched(cache.recorder(_feed_fn(10), run_id="20260101T000000Z"), limit=50)
+        fetch_feed_batched(cache.recorder(_feed_fn(20), run_id="20260102T000000Z"), limit=50)
+        assert len(fetch_feed_batched(cache.replayer(), limit=50)) == 20
+
+    def test_simulates_recorded_latency(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache"))
+
+        def slow(limit, offset, **kwargs):
+            time.sleep(0.02)
+            return _feed_fn(50)(limit, offset)
+
+        fetch_feed_batched(cache.recorder(slow, run_id="run1"), limit=50)
+        sleeps = []
+        fetch_feed_batched(cache.replayer("run1", simulate_latency=True, sleep=sleeps.append),
+                           limit=100)
+        assert len(sleeps) == 1 and sleeps[0] >= 0.02
+
+    def test_missing_run_raises(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache"))
+        try:
+            cache.replayer()
+            assert False, "expected FileNotFoundError"
+        except FileNotFoundError:
+            pass
+
+    def test_evicts_old_runs(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache"), max_age_days=7)
+        fetch_feed_batched(cache.recorder(_feed_fn(10), run_id="old"), limit=50)
+        old = time.time() - 10 * 86400
+        for name in os.listdir(tmp_path / "cache" / "old"):
+            os.utime(tmp_path / "cache" / "old" / name, (old, old))
+        fetch_feed_batched(cache.recorder(_feed_fn(10), run_id="new"), limit=50)
+        assert cache.runs() == ["new"]
+
+    def test_evicts_oldest_runs_over_size_budget(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache"), max_bytes=10**9)
+        for run_id in ("a", "b", "c"):
+            fetch_feed_batched(cache.recorder(_feed_fn(50), run_id=run_id), limit=50)
+        cache.max_bytes = 1
+        cache.evict(keep="c")
+        assert cache.runs() == ["c"]
+
+    def test_fetch_cli_replays_without_cookies(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        cache = ResponseCache(str(tmp_path / "cache"))
+        fetch_feed_batched(cache.recorder(_feed_fn(80), run_id="run1"), limit=200)
+
+        monkeypatch.delenv("LINKEDIN_JSESSIONID", raising=False)
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", [
+            "linkedin_feed.py", "fetch", "--replay", str(tmp_path / "cache"),
+        ])
+        main()
+
+        out = capsys.readouterr().out
+        assert "Fetched:      80" in out
+        assert "New:          80" in out
+
+
+class TestFetchTelemetry:
+    def test_records_each_merged_batch(self):
+        stats = {}
+        fetch_feed_batched(_feed_fn(120), limit=200, stats=stats)
+        assert [(b["offset"], b["posts"], b["attempts"]) for b in stats["batches"]] == [
+            (0, 50, 1), (50, 50, 1), (100, 20, 1), (150, 0, 1),
+        ]
+        assert all(b["latency_ms"] >= 0 for b in stats["batches"])
+        assert stats["api_ms"] >= 0
+
+    def test_counts_attempts_and_records_errors(self):
+        fn, calls = _flaky(10)
+        stats = {}
+        fetch_feed_batched(fn, limit=100, retry_delay=0, stats=stats)
+        [batch] = stats["batches"]
+        assert batch["attempts"] == 2
+        assert batch["error"] == "blip"
+
+    def test_counts_rate_limited_caller_retries(self):
+        clock = FakeClock()
+        fn, calls = _flaky(2)
+        caller = RateLimitedCaller(fn, max_retries=3, clock=clock, sleep=clock.sleep,
+                                   rand=lambda: 0.0)
+        stats = {}
+        fetch_feed_batched(caller, limit=1, retries=0, stats=stats)
+        assert stats["batches"][0]["attempts"] == 3
+
+    def test_store_posts_records_phase_timings(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        stats = {}
+        store_posts(db, _feed_fn(10)(limit=10, offset=0), stats=stats)
+        assert stats["parse_ms"] >= 0
+        assert stats["insert_ms"] >= 0
+
+    def test_log_fetch_stores_telemetry(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        telemetry = {"api_ms": 900.0, "parse_ms": 2.0, "insert_ms": 5.0, "batches": [
+            {"offset": 0, "latency_ms": 400.0, "attempts": 1, "posts": 50, "error": None},
+            {"offset": 50, "latency_ms": 500.0, "attempts": 3, "posts": 0, "error": "429"},
+        ]}
+        fetch_id = log_fetch(db, fetched=50, inserted=10, telemetry=telemetry)
+        log_commit_time(db, fetch_id, 1.5)
+
+        stats = get_fetch_stats(db)
+        assert stats["runs"] == 1
+        assert stats["batches"] == 2
+        assert stats["retries"] == 2
+        assert stats["batch_latency_ms"] == {"p50": 400.0, "p95": 500.0, "p99": 500.0}
+        assert stats["phases_ms"]["api_ms"]["p50"] == 900.0
+        assert stats["phases_ms"]["commit_ms"]["p50"] == 1.5
+        assert stats["slowest_batches"][0]["offset"] == 50
+        assert stats["slowest_batches"][0]["error"] == "429"
+        assert stats["daily"][0]["new_ratio"] == 0.2
+
+    def test_stats_are_empty_without_telemetry(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        log_fetch(db, fetched=0, inserted=0)
+        stats = get_fetch_stats(db)
+        assert stats["runs"] == 1
+        assert stats["batch_latency_ms"] == {"p50": None, "p95": None, "p99": None}
+        assert stats["daily"][0]["new_ratio"] is None
+        assert stats["slowest_batches"] == []
+
+    def test_stats_cli_after_fetch(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        cache = ResponseCache(str(tmp_path / "cache"))
+        fetch_feed_batched(cache.recorder(_feed_fn(80), run_id="run1"), limit=200)
+
+        monkeypatch.delenv("LINKEDIN_JSESSIONID", raising=False)
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", [
+            "linkedin_feed.py", "fetch", "--replay", str(tmp_path / "cache"),
+        ])
+        main()
+        capsys.readouterr()
+
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "stats", "--slowest", "2"])
+        main()
+        stats = json.loads(capsys.readouterr().out)
+        assert stats["runs"] == 1
+        assert stats["batches"] == 3
+        assert len(stats["slowest_batches"]) == 2
+        assert stats["daily"][0]["fetched"] == 80
+        assert stats["phases_ms"]["commit_ms"]["p50"] is not None
+
+
+class TestFetchDaemon:
+    def _daemon(self, tmp_path, fetch_fn, clock, **kwargs):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+
+        def wait(seconds):
+            clock.sleep(seconds)
+            return False
+
+        options = {"interval": 100, "jitter": 10, "clock": clock, "wait": wait,
+                   "rand": lambda low, high: high,
+                   "status_path": str(tmp_path / "status.json")}
+        options.update(kwargs)
+        return db, FetchDaemon(db, fetch_fn, **options)
+
+    def test_runs_on_schedule_with_jitter(self, tmp_path):
+        clock = FakeClock()
+        starts = []
+
+        def fetch(stats):
+            starts.append(clock.now)
+            return _feed_fn(10)(limit=10, offset=0)
+
+        db, daemon = self._daemon(tmp_path, fetch, clock)
+        daemon.run(max_runs=3)
+        assert starts == [0.0, 110.0, 210.0]
+        assert len(get_fetch_log(db)) == 3
+        assert get_fetch_log(db)[-1]["inserted"] == 10
+
+    def test_skips_slots_overrun_by_a_long_fetch(self, tmp_path):
+        clock = FakeClock()
+        starts = []
+
+        def fetch(stats):
+            starts.append(clock.now)
+            clock.now += 250
+            return []
+
+        _, daemon = self._daemon(tmp_path, fetch, clock)
+        daemon.run(max_runs=2)
+        assert starts == [0.0, 310.0]
+        assert daemon.status["skipped"] == 2
+
+    def test_failed_run_is_recorded_and_rolled_back(self, tmp_path):
+        clock = FakeClock()
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        conn = connect(db)
+
+        def fetch(stats):
+            store_posts(db, _feed_fn(5)(limit=5, offset=0), conn=conn)
+            raise RuntimeError("cookies expired")
+
+        _, daemon = self._daemon(tmp_path, fetch, clock, conn=conn)
+        daemon.run(max_runs=2)
+        conn.close()
+        assert daemon.status["failures"] == 2
+        assert daemon.status["last_run"]["error"] == "cookies expired"
+        assert get_unprocessed(db) == []
+
+    def test_stop_ends_the_wait_and_writes_status(self, tmp_path):
+        clock = FakeClock()
+        _, daemon = self._daemon(tmp_path, lambda stats: [], clock)
+
+        def wait(seconds):
+            if daemon.status["runs"]:
+                daemon.stop()
+                return True
+            return False
+
+        daemon.wait = wait
+        daemon.run()
+        status = json.loads((tmp_path / "status.json").read_text())
+        assert status["state"] == "stopped"
+        assert status["runs"] == 1
+        assert status["last_run"]["fetched"] == 0
+        assert status["next_run_at"] is None
+
+    def test_record_fetch_commits_with_telemetry(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        stats = {}
+        posts = fetch_feed_batched(_feed_fn(60), limit=200, stats=stats)
+        summary = record_fetch(db, posts, stats)
+        assert summary == {"fetched": 60, "inserted": 60, "cutoff_offset": None}
+        assert get_fetch_stats(db)["batches"] == 3
+
+    def test_record_fetch_leaves_no_write_transaction_open(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        with session(db) as conn:
+            record_fetch(db, fetch_feed_batched(_feed_fn(10), limit=200), conn=conn)
+            assert not conn.in_transaction
+            mark_processed(db, [])  # another connection can write meanwhile
+            other = sqlite3.connect(db)
+            assert other.execute("SELECT commit_ms FROM fetch_phases").fetchone()[0] is not None
+            other.close()
+
+
+NETWORK_MODULES = ("linkedin_api", "requests", "urllib3", "bs4")
+IMPORT_CHECK = (
+    "import json, sys, linkedin_feed\n"
+    "sys.argv = ['linkedin_feed.py'] + sys.argv[1:]\n"
+    "linkedin_feed.main()\n"
+    "loaded = [m for m in %r if m in sys.modules]\n"
+    "sys.stderr.write(json.dumps(loaded))\n"
+) % (NETWORK_MODULES,)
+
+
+class TestLazyImports:
+    def _loaded_network_modules(self, tmp_path, *args):
+        env = dict(os.environ, LINKEDIN_DB_PATH=str(tmp_path / "test.db"))
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_CHECK, *args],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(result.stderr.strip().splitlines()[-1])
+
+    def test_import_skips_network_stack(self):
+        result = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, linkedin_feed; print([m for m in %r if m in sys.modules])"
+             % (NETWORK_MODULES,)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        )
+        assert result.stdout.strip() == "[]"
+
+    def test_local_commands_skip_network_stack(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db)
+        for args in (["unprocessed"], ["posts"], ["digest"], ["search", "Post"],
+                     ["stats"], ["mark-processed", "--all"]):
+            assert self._loaded_network_modules(tmp_path, *args) == [], args
+
+    def test_replayed_fetch_skips_network_stack(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache"))
+        fetch_feed_batched(cache.recorder(_feed_fn(10), run_id="run1"), limit=200)
+        loaded = self._loaded_network_modules(
+            tmp_path, "fetch", "--replay", str(tmp_path / "cache"))
+        assert loaded == []
+
+
+class TestFeedService:
+    def _get(self, service, path, **params):
+        status, body = service.handle("GET", path, {k: str(v) for k, v in params.items()})
+        return status, json.loads(body)
+
+    def _post(self, service, path, payload):
+        status, body = service.handle("POST", path, body=json.dumps(payload).encode())
+        return status, json.loads(body)
+
+    def test_serves_queries_like_the_cli(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_search_posts(db)
+        service = FeedService(db)
+        assert self._get(service, "/unprocessed") == (200, get_unprocessed(db))
+        assert self._get(service, "/posts")[1] == get_posts(db)
+        status, results = self._get(service, "/search", q="rails")
+        assert status == 200
+        assert [r["url"] for r in results] == [r["url"] for r in search_posts(db, "rails")]
+        assert self._get(service, "/health")[1] == {"ok": True, "unprocessed": 3}
+        assert len(self._get(service, "/digest")[1][0]["urls"]) == 3
+
+    def test_caches_until_a_write_through_the_service(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db)
+        service = FeedService(db)
+        self._get(service, "/unprocessed")
+        assert len(service.cache) == 1
+        assert self._post(service, "/mark-processed", {"urls": urls[:2]}) == (
+            200, {"batch_id": 1, "marked": 2})
+        assert service.cache == {}
+        assert [p["url"] for p in self._get(service, "/unprocessed")[1]] == urls[2:]
+
+    def test_cache_sees_writes_from_other_connections(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db)
+        service = FeedService(db)
+        assert len(self._get(service, "/unprocessed")[1]) == 3
+        mark_processed(db, urls)
+        assert self._get(service, "/unprocessed")[1] == []
+
+    def test_mark_all_processed(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db)
+        service = FeedService(db)
+        assert self._post(service, "/mark-processed", {"all": True}) == (
+            200, {"batch_id": 1, "marked": 3})
+        assert get_unprocessed(db) == []
+        assert self._post(service, "/undo-processed", {"batch_id": 1}) == (200, {"unmarked": 3})
+        assert count_unprocessed(db) == 3
+
+    def test_bad_requests(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        service = FeedService(db)
+        assert self._get(service, "/nope")[0] == 404
+        assert self._get(service, "/search")[0] == 400
+        assert self._get(service, "/search", q='"unbalanced')[0] == 400
+        assert self._get(service, "/posts", after="yesterday")[0] == 400
+        assert self._post(service, "/mark-processed", {"urls": "x"})[0] == 400
+        assert self._post(service, "/undo-processed", {"batch_id": "1"})[0] == 400
+        assert service.handle("POST", "/mark-processed", body=b"{")[0] == 400
+        assert self._post(service, "/mark-processed", {"urls": [1, {"a": 2}]})[0] == 400
+        assert self._post(service, "/ack", {"lease_id": "x", "urls": [None]})[0] == 400
+        assert self._post(service, "/claim", {"limit": None})[0] == 400
+        assert self._post(service, "/claim", {"limit": -3})[0] == 400
+        assert self._get(service, "/unprocessed", limit="-1")[0] == 400
+        assert self._get(service, "/posts", limit="0")[0] == 400
+        assert not service.conn.in_transaction
+
+    def test_database_errors_return_500_and_roll_back(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db)
+        service = FeedService(db)
+        service.handle("GET", "/health")
+        service.conn.execute("CREATE TRIGGER fail_update BEFORE UPDATE ON posts "
+                             "BEGIN SELECT RAISE(ABORT, 'no updates'); END")
+        service.conn.commit()
+        status, body = self._post(service, "/claim", {"limit": 2})
+        assert status == 500
+        assert "no updates" in body["error"]
+        assert not service.conn.in_transaction
+
+    def test_min_score_uses_the_startup_scorer(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        store_posts(db, [
+            {"url": "https://linkedin.com/post/1", "content": "Deploying Rails with Kamal"},
+            {"url": "https://linkedin.com/post/2", "content": "Weekend hiking photos"},
+        ])
+        service = FeedService(db, scorer=load_scorer(_write_angles(tmp_path)))
+        status, posts = self._get(service, "/unprocessed", min_score="1",
+                                  angles=str(tmp_path / "missing.json"))
+        assert status == 200
+        assert [p["url"] for p in posts] == ["https://linkedin.com/post/1"]
+
+    def test_http_round_trip(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db)
+        server = make_server(db, port=0)
+
+        def serve():
+            server.serve_forever()
+            server.service.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{base}/unprocessed?collapse=1") as resp:
+                assert resp.headers["Content-Type"].startswith("application/json")
+                assert len(json.loads(resp.read())) == 3
+            request = urllib.request.Request(
+                f"{base}/mark-processed", data=json.dumps({"urls": urls[:1]}).encode(),
+                method="POST")
+            with urllib.request.urlopen(request) as resp:
+                assert json.loads(resp.read())["marked"] == 1
+            with urllib.request.urlopen(f"{base}/unprocessed") as resp:
+                assert len(json.loads(resp.read())) == 2
+            try:
+                urllib.request.urlopen(f"{base}/missing")
+                assert False, "expected 404"
+            except urllib.error.HTTPError as exc:
+                assert exc.code == 404
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+def _write_accounts(tmp_path, accounts):
+    path = tmp_path / "accounts.json"
+    path.write_text(json.dumps(accounts))
+    return str(path)
+
+
+class TestAccounts:
+    def test_same_url_is_stored_per_account(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        posts = [{"url": "https://linkedin.com/post/1", "old": "1h"}]
+        assert store_posts(db, posts, account="alice") == 1
+        assert store_posts(db, posts, account="bob") == 1
+        assert store_posts(db, posts, account="bob") == 0
+        assert count_unprocessed(db) == 2
+        assert get_known_urls(db, ["https://linkedin.com/post/1"], account="carol") == set()
+
+    def test_unprocessed_and_mark_processed_are_scoped(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        posts = [{"url": f"https://linkedin.com/post/{i}", "old": "1h"} for i in range(3)]
+        store_posts(db, posts, account="alice")
+        store_posts(db, posts[:2], account="bob")
+        mark_processed(db, [posts[0]["url"]], account="alice")
+        assert [p["url"] for p in get_unprocessed(db, account="alice")] == [
+            posts[1]["url"], posts[2]["url"]]
+        assert count_unprocessed(db, account="bob") == 2
+
+    def test_mark_processed_all_cli_is_scoped(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        posts = [{"url": f"https://linkedin.com/post/{i}", "old": "1h"} for i in range(3)]
+        store_posts(db, posts, account="alice")
+        store_posts(db, posts, account="bob")
+
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", [
+            "linkedin_feed.py", "mark-processed", "--all", "--account", "alice",
+        ])
+        main()
+
+        assert "Marked 3" in capsys.readouterr().out
+        assert count_unprocessed(db, account="alice") == 0
+        assert count_unprocessed(db, account="bob") == 3
+
+    def test_upgrade_keeps_rowids_and_search_index(self, tmp_path, monkeypatch):
+        import linkedin_feed
+        db = str(tmp_path / "test.db")
+        monkeypatch.setattr(linkedin_feed, "MIGRATIONS", linkedin_feed.MIGRATIONS[:6])
+        init_db(db)
+        monkeypatch.undo()
+        conn = sqlite3.connect(db)
+        conn.executemany(
+            "INSERT INTO posts (url, content, fetched_at) VALUES (?, ?, 'x')",
+            [(f"https://linkedin.com/post/{i}", f"Post {i}") for i in (5, 3, 9)])
+        conn.execute("DELETE FROM posts WHERE url = 'https://linkedin.com/post/3'")
+        rowids = dict(conn.execute("SELECT url, rowid FROM posts"))
+        conn.commit()
+        conn.close()
+
+        init_db(db)
+
+        conn = sqlite3.connect(db)
+        assert dict(conn.execute("SELECT url, id FROM posts")) == rowids
+        conn.close()
+        assert len(search_posts(db, "post")) == 2
+        store_posts(db, [{"url": "https://linkedin.com/post/5", "content": "Kamal", "old": "1h"}],
+                    account="bob")
+        assert [p["url"] for p in search_posts(db, "kamal", account="bob")] == [
+            "https://linkedin.com/post/5"]
+
+    def test_load_accounts_rejects_incomplete_entries(self, tmp_path):
+        path = _write_accounts(tmp_path, [{"name": "alice", "jsessionid": "j"}])
+        try:
+            load_accounts(path)
+            assert False, "expected ValueError"
+        except ValueError as exc:
+            assert "li_at" in str(exc)
+        path = _write_accounts(tmp_path, [{"name": "a", "jsessionid": "j", "li_at": "l"}] * 2)
+        try:
+            load_accounts(path)
+            assert False, "expected ValueError"
+        except ValueError as exc:
+            assert "twice" in str(exc)
+
+    def test_fetches_accounts_in_parallel_with_one_writer(self, tmp_path, monkeypatch):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        barrier = threading.Barrier(2, timeout=5)
+        seen = {}
+
+        def fake_fetch_feed(jsessionid, li_at, limit, rate_options=None, **options):
+            seen[jsessionid] = (rate_options, threading.current_thread().name)
+            barrier.wait()
+            return fetch_feed_batched(_feed_fn(limit), limit=limit, stats=options["stats"])
+
+        monkeypatch.setattr("linkedin_feed.fetch_feed", fake_fetch_feed)
+        accounts = [
+            {"name": "alice", "jsessionid": "ja", "li_at": "la"},
+            {"name": "bob", "jsessionid": "jb", "li_at": "lb", "rate": 0.5},
+        ]
+        conn = connect(db)
+        writer = threading.current_thread().name
+        summaries = fetch_accounts(db, accounts, limit=10, rate_options={"rate": 2.0}, conn=conn)
+        conn.close()
+
+        assert summaries["alice"]["inserted"] == 10
+        assert summaries["bob"]["inserted"] == 10
+        assert seen["ja"][0] == {"rate": 2.0}
+        assert seen["jb"][0] == {"rate": 0.5}
+        assert writer not in {seen["ja"][1], seen["jb"][1]}
+        assert count_unprocessed(db, account="alice") == 10
+        assert {row["account"] for row in get_fetch_log(db)} == {"alice", "bob"}
+
+    def test_failed_account_does_not_stop_the_others(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+
+        def fake_fetch_feed(jsessionid, li_at, limit, rate_options=None, **options):
+            if jsessionid == "jb":
+                raise ConnectionError("expired cookies")
+            return _feed_fn(limit)(limit=limit, offset=0)
+
+        monkeypatch.setattr("linkedin_feed.fetch_feed", fake_fetch_feed)
+        path = _write_accounts(tmp_path, [
+            {"name": "alice", "jsessionid": "ja", "li_at": "la"},
+            {"name": "bob", "jsessionid": "jb", "li_at": "lb"},
+        ])
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "fetch", "5", "--accounts", path])
+        try:
+            main()
+            assert False, "expected exit"
+        except SystemExit as exc:
+            assert exc.code == 1
+
+        out = capsys.readouterr().out
+        assert "alice: fetched 5, new 5, unprocessed 5" in out
+        assert "bob: failed (expired cookies)" in out
+
+
+class TestLeases:
+    NOW = datetime(2026, 2, 8, 12, 0, 0, tzinfo=timezone.utc)
+
+    def test_claims_are_disjoint_oldest_first(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=5)
+        first = claim_posts(db, limit=3, now=self.NOW)
+        second = claim_posts(db, limit=3, now=self.NOW)
+        assert [p["url"] for p in first["posts"]] == urls[:3]
+        assert [p["url"] for p in second["posts"]] == urls[3:]
+        assert first["lease_id"] != second["lease_id"]
+        assert claim_posts(db, now=self.NOW)["posts"] == []
+
+    def test_expired_lease_returns_to_the_pool(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=2)
+        stale = claim_posts(db, lease_seconds=60, now=self.NOW)
+        later = self.NOW + timedelta(seconds=61)
+        fresh = claim_posts(db, now=later)
+        assert [p["url"] for p in fresh["posts"]] == urls
+        assert ack_lease(db, stale["lease_id"])["marked"] == 0
+        assert ack_lease(db, fresh["lease_id"], urls=urls[:1])["marked"] == 1
+        assert [p["url"] for p in get_unprocessed(db)] == urls[1:]
+
+    def test_release_and_mark_processed_clear_leases(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=3)
+        lease = claim_posts(db, now=self.NOW)
+        mark_processed(db, urls[:1])
+        assert release_lease(db, lease["lease_id"]) == 2
+        assert [p["url"] for p in claim_posts(db, now=self.NOW)["posts"]] == urls[1:]
+
+    def test_claim_rejects_limit_below_one(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=3)
+        with pytest.raises(ValueError, match="at least 1"):
+            claim_posts(db, limit=-1, now=self.NOW)
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "claim", "0"])
+        with pytest.raises(SystemExit):
+            main()
+        assert "at least 1" in capsys.readouterr().err
+        assert len(claim_posts(db, now=self.NOW)["posts"]) == 3
+
+    def test_mark_all_processed_skips_held_leases(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=5)
+        lease = claim_posts(db, limit=2, lease_seconds=60, now=self.NOW)
+        assert mark_all_processed(db, now=self.NOW)["marked"] == 3
+        assert [p["url"] for p in get_unprocessed(db)] == urls[:2]
+        assert ack_lease(db, lease["lease_id"])["marked"] == 2
+        assert count_unprocessed(db) == 0
+
+    def test_mark_all_processed_takes_expired_leases(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=3)
+        claim_posts(db, limit=2, lease_seconds=60, now=self.NOW)
+        later = self.NOW + timedelta(seconds=61)
+        assert mark_all_processed(db, now=later)["marked"] == 3
+
+    def test_concurrent_workers_never_share_posts(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=200)
+        claimed = []
+
+        def worker():
+            while True:
+                posts = claim_posts(db, limit=7)["posts"]
+                if not posts:
+                    return
+                claimed.extend(p["url"] for p in posts)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(claimed) == len(set(claimed)) == 200
+
+    def test_claim_uses_unprocessed_index(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        conn = sqlite3.connect(db)
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM posts WHERE processed = 0 AND "
+            "(lease_expires_at IS NULL OR lease_expires_at <= ?) ORDER BY rowid LIMIT 5", ("x",)))
+        conn.close()
+        assert "idx_posts_unprocessed" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_service_endpoints(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        urls = _seed_posts(db, count=3)
+        service = FeedService(db)
+        status, body = service.handle("POST", "/claim", body=b'{"limit": 2}')
+        lease = json.loads(body)
+        assert status == 200
+        assert [p["url"] for p in lease["posts"]] == urls[:2]
+        ack = json.dumps({"lease_id": lease["lease_id"], "urls": urls[:1]}).encode()
+        assert json.loads(service.handle("POST", "/ack", body=ack)[1])["marked"] == 1
+        release = json.dumps({"lease_id": lease["lease_id"]}).encode()
+        assert json.loads(service.handle("POST", "/release", body=release)[1]) == {"released": 1}
+        assert service.handle("POST", "/ack", body=b"{}")[0] == 400
+        service.close()
+
+
+class TestPagination:
+    def _seed(self, db):
+        """25 posts: ages spread over days, with ties on posted_at."""
+        posts = [{"url": f"https://linkedin.com/post/{i}", "content": f"Post {i}",
+                  "old": f"{i % 4 + 1}d"} for i in range(25)]
+        store_posts(db, posts)
+        return posts
+
+    def _walk(self, page_fn, db, limit, **options):
+        urls, cursor, pages = [], None, 0
+        while True:
+            page = page_fn(db, limit=limit, cursor=cursor, **options)
+            urls += [p["url"] for p in page["posts"]]
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return urls, pages
+
+    def test_posts_pages_match_full_query_across_ties(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        self._seed(db)
+        expected = [p["url"] for p in get_posts(db)]
+        assert self._walk(get_posts_page, db, limit=4) == (expected, 7)
+        assert self._walk(get_posts_page, db, limit=25) == (expected, 1)
+
+    def test_unprocessed_pages_follow_filters(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        posts = self._seed(db)
+        mark_processed(db, [p["url"] for p in posts[:10]])
+        urls, pages = self._walk(get_unprocessed_page, db, limit=5)
+        assert urls == [p["url"] for p in posts[10:]]
+        assert pages == 3
+        assert "id" not in get_unprocessed_page(db, limit=1)["posts"][0]
+
+    def test_iter_pages_is_lazy(self, tmp_path, monkeypatch):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        self._seed(db)
+        calls = []
+
+        def page_fn(db_path, **options):
+            calls.append(options["cursor"])
+            return get_unprocessed_page(db_path, **options)
+
+        posts = iter_pages(page_fn, db, page_size=10)
+        assert [next(posts) for _ in range(10)] and len(calls) == 1
+        assert len(list(posts)) == 15
+        assert len(calls) == 3
+
+    def test_invalid_cursor(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        for cursor in ("nope", "WzFd"):  # WzFd is [1]: an unprocessed cursor
+            try:
+                get_posts_page(db, cursor=cursor)
+                assert False, "expected ValueError"
+            except ValueError as exc:
+                assert "Invalid cursor" in str(exc)
+
+    def test_limit_below_one_is_rejected(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        for page_fn in (get_unprocessed_page, get_posts_page):
+            for limit in (0, -1):
+                with pytest.raises(ValueError, match="at least 1"):
+                    page_fn(db, limit=limit)
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "unprocessed", "--limit", "-1"])
+        with pytest.raises(SystemExit):
+            main()
+        assert "at least 1" in capsys.readouterr().err
+
+    def test_page_queries_seek_the_index(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        conn = connect(db)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        get_posts_page(db, cursor="WyIyMDI2LTAxLTAxIiwgNV0", conn=conn)
+        get_unprocessed_page(db, cursor="WzVd", conn=conn)
+        for sql in statements:
+            plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql))
+            assert "SEARCH posts USING" in plan and "TEMP B-TREE" not in plan, plan
+        conn.close()
+
+    def test_cli_pages(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        self._seed(db)
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "posts", "--limit", "20"])
+        main()
+        first = json.loads(capsys.readouterr().out)
+        monkeypatch.setattr(sys, "argv", [
+            "linkedin_feed.py", "posts", "--cursor", first["next_cursor"], "--format", "ndjson"])
+        main()
+        captured = capsys.readouterr()
+        assert len(first["posts"]) == 20
+        assert len(captured.out.splitlines()) == 5
+        assert "Next cursor" not in captured.err
+
+    def test_service_pages(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        self._seed(db)
+        service = FeedService(db)
+        status, body = service.handle("GET", "/unprocessed", {"limit": "10"})
+        page = json.loads(body)
+        assert status == 200 and len(page["posts"]) == 10
+        status, body = service.handle("GET", "/unprocessed", {"cursor": page["next_cursor"]})
+        assert [p["url"] for p in json.loads(body)["posts"]][0] == "https://linkedin.com/post/10"
+        assert service.handle("GET", "/posts", {"cursor": "bad"})[0] == 400
+        service.close()
+
+
+class TestExport:
+    def _read(self, directory):
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+        rows = []
+        for chunk in manifest["chunks"]:
+            with gzip.open(os.path.join(directory, chunk["file"]), "rt") as f:
+                rows += [json.loads(line) for line in f]
+        return manifest, rows
+
+    def test_exports_only_new_posts(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        out = str(tmp_path / "export")
+        init_db(db)
+        store_posts(db, [{"url": f"https://linkedin.com/post/{i}", "old": f"{i % 3 + 1}d"}
+                         for i in range(9)])
+        first = export_posts(db, out, export_format="ndjson.gz")
+        assert (first["rows"], first["chunks"], first["watermark"]) == (9, 3, 9)
+        assert export_posts(db, out, export_format="ndjson.gz")["rows"] == 0
+
+        store_posts(db, [{"url": "https://linkedin.com/post/new", "old": "1h"}])
+        second = export_posts(db, out, export_format="ndjson.gz")
+        assert (second["rows"], second["chunks"], second["watermark"]) == (1, 1, 10)
+
+        manifest, rows = self._read(out)
+        assert manifest["watermark"] == 10
+        assert len(manifest["chunks"]) == 4
+        assert sorted(row["id"] for row in rows) == list(range(1, 11))
+        assert sum(chunk["bytes"] for chunk in manifest["chunks"]) == first["bytes"] + second["bytes"]
+
+    def test_chunks_are_grouped_by_day(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        out = str(tmp_path / "export")
+        init_db(db)
+        store_posts(db, [{"url": f"https://linkedin.com/post/{i}", "old": f"{i % 2 + 1}d"}
+                         for i in range(6)])
+        conn = sqlite3.connect(db)
+        conn.execute("UPDATE posts SET posted_at = NULL WHERE id = 6")
+        conn.commit()
+        conn.close()
+        export_posts(db, out, export_format="ndjson.gz")
+        manifest, _ = self._read(out)
+        for chunk in manifest["chunks"]:
+            with gzip.open(os.path.join(out, chunk["file"]), "rt") as f:
+                days = {(json.loads(line)["posted_at"] or "undated")[:10] for line in f}
+            assert days == {chunk["day"]}
+        assert sorted(chunk["rows"] for chunk in manifest["chunks"]) == [1, 2, 3]
+
+    def test_watermark_is_per_directory(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=2)
+        export_posts(db, str(tmp_path / "a"), export_format="ndjson.gz")
+        assert export_posts(db, str(tmp_path / "b"), export_format="ndjson.gz")["rows"] == 2
+
+    def test_export_reads_only_new_rows(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=3)
+        conn = connect(db)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        export_posts(db, str(tmp_path / "export"), export_format="ndjson.gz", conn=conn)
+        [select] = [sql for sql in statements if sql.startswith("SELECT posts.id AS id, account")]
+        plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + select))
+        conn.close()
+        assert "rowid>?" in plan
+
+    def test_parquet(self, tmp_path):
+        pq = pytest.importorskip("pyarrow.parquet")
+        db = str(tmp_path / "test.db")
+        out = str(tmp_path / "export")
+        init_db(db)
+        _seed_posts(db, count=3)
+        export_posts(db, out, export_format="parquet")
+        with open(os.path.join(out, "manifest.json")) as f:
+            [chunk] = json.load(f)["chunks"]
+        assert pq.read_table(os.path.join(out, chunk["file"])).num_rows == 3
+
+
+class TestAuthors:
+    def _post(self, i, name, profile="", old="1h"):
+        return {"url": f"https://linkedin.com/post/{i}", "author_name": name,
+                "author_profile": profile, "content": f"Post {i}", "old": old}
+
+    def test_missing_author_is_empty_in_every_query(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        store_posts(db, [self._post(1, "")])
+        expected = ("", "")
+        assert [(p["author_name"], p["author_profile"]) for p in get_unprocessed(db)] == [expected]
+        assert [(p["author_name"], p["author_profile"]) for p in get_posts(db)] == [expected]
+        page = get_unprocessed_page(db)["posts"]
+        assert [(p["author_name"], p["author_profile"]) for p in page] == [expected]
+        claimed = claim_posts(db)["posts"]
+        assert [(p["author_name"], p["author_profile"]) for p in claimed] == [expected]
+        found = search_posts(db, "post")
+        assert [(p["author_name"], p["author_profile"]) for p in found] == [expected]
+
+    def test_authors_are_interned_by_profile(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        alice = "https://www.linkedin.com/in/alice"
+        store_posts(db, [self._post(1, "Alice", alice), self._post(2, "Alice", alice),
+                         self._post(3, "Bob"), self._post(4, "Carol")])
+        store_posts(db, [self._post(5, "Alice Smith", alice)])
+        conn = sqlite3.connect(db)
+        assert conn.execute("SELECT COUNT(*) FROM authors").fetchone()[0] == 3
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(posts)")]
+        conn.close()
+        assert "author_name" not in columns
+        assert [(p["author_name"], p["author_profile"]) for p in get_unprocessed(db)] == [
+            ("Alice Smith", alice), ("Alice Smith", alice), ("Bob", ""), ("Carol", ""),
+            ("Alice Smith", alice)]
+
+    def test_aggregates_are_maintained_on_insert(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        alice = "https://www.linkedin.com/in/alice"
+        store_posts(db, [self._post(1, "Alice", alice, "3d"), self._post(2, "Bob", old="1d")])
+        store_posts(db, [self._post(3, "Alice", alice, "2d"), self._post(1, "Alice", alice)])
+        [top, second] = get_authors(db)
+        assert (top["name"], top["post_count"], second["post_count"]) == ("Alice", 2, 1)
+        posted_at = {p["url"]: p["posted_at"] for p in get_posts(db)}
+        assert top["last_posted_at"] == posted_at["https://linkedin.com/post/3"]
+        assert get_authors(db, limit=1) == [top]
+
+    def test_rename_keeps_search_in_sync(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        alice = "https://www.linkedin.com/in/alice"
+        store_posts(db, [self._post(1, "Alice", alice)])
+        store_posts(db, [self._post(2, "Alicia", alice)])
+        assert search_posts(db, "alice") == []
+        assert len(search_posts(db, "alicia")) == 2
+
+    def test_upgrade_moves_authors_out_of_posts(self, tmp_path, monkeypatch):
+        import linkedin_feed
+        db = str(tmp_path / "test.db")
+        monkeypatch.setattr(linkedin_feed, "MIGRATIONS", linkedin_feed.MIGRATIONS[:10])
+        init_db(db)
+        monkeypatch.undo()
+        conn = sqlite3.connect(db)
+        conn.executemany(
+            "INSERT INTO posts (url, author_name, author_profile, content, posted_at, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [("https://linkedin.com/post/1", "Alice", "https://in/alice", "Kamal", "2026-01-01", "a"),
+             ("https://linkedin.com/post/2", "Alice S", "https://in/alice", "Rails", "2026-01-03", "b"),
+             ("https://linkedin.com/post/3", "Bob", "", "Hiring", None, "c")])
+        conn.commit()
+        conn.close()
+
+        init_db(db)
+
+        assert [(p["author_name"], p["author_profile"]) for p in get_unprocessed(db)] == [
+            ("Alice S", "https://in/alice"), ("Alice S", "https://in/alice"), ("Bob", "")]
+        assert [(a["name"], a["post_count"], a["last_posted_at"]) for a in get_authors(db)] == [
+            ("Alice S", 2, "2026-01-03"), ("Bob", 1, None)]
+        assert [p["url"] for p in search_posts(db, "bob")] == ["https://linkedin.com/post/3"]
+
+
+class TestTrends:
+    def _rollups(self, db):
+        conn = sqlite3.connect(db)
+        tables = {table: sorted(conn.execute(f"SELECT * FROM {table} WHERE posts + processed > 0"
+                                             if table == "daily_posts" else
+                                             f"SELECT * FROM {table}"))
+                  for table in ("daily_posts", "daily_activity")}
+        conn.close()
+        return tables
+
+    def _activity(self, db):
+        posts = [{"url": f"https://linkedin.com/post/{i}", "content": f"Post {i}",
+                  "old": f"{i % 3 + 1}d"} for i in range(12)]
+        record_fetch(db, posts[:8], account="alice")
+        record_fetch(db, posts, account="alice")
+        record_fetch(db, posts[:5], account="bob")
+        mark_processed(db, [p["url"] for p in posts[:3]], account="alice")
+        batch = mark_all_processed(db, account="bob")["batch_id"]
+        undo_processed(db, batch)
+        lease = claim_posts(db, limit=2)
+        ack_lease(db, lease["lease_id"])
+        return posts
+
+    def test_incremental_rollups_match_a_rebuild(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        self._activity(db)
+        incremental = self._rollups(db)
+        assert rebuild_trends(db) == 17
+        assert self._rollups(db) == incremental
+
+    def test_trends_per_day(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        self._activity(db)
+        [today] = [row for row in get_trends(db) if row["fetches"]]
+        assert (today["fetches"], today["fetched"], today["stored"], today["marked"]) == (
+            3, 25, 17, 5)
+        assert today["new_ratio"] == round(17 / 25, 3)
+        assert today["backlog"] == count_unprocessed(db) == 12
+        assert sum(row["posts"] for row in get_trends(db, account="bob")) == 5
+        assert get_trends(db, since="2999-01-01") == []
+
+    def test_backlog_carries_over_from_earlier_days(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=4)
+        conn = sqlite3.connect(db)
+        conn.execute("UPDATE posts SET fetched_at = '2026-01-01T08:00:00+00:00'")
+        conn.commit()
+        conn.close()
+        rebuild_trends(db)
+        [row] = [row for row in get_trends(db, since="2026-01-02") if row["posts"]]
+        assert row["backlog"] == 4
+
+    def test_upgrade_backfills_rollups(self, tmp_path):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        self._activity(db)
+        incremental = self._rollups(db)
+        conn = sqlite3.connect(db)
+        conn.execute("DROP TABLE daily_posts")
+        conn.execute("DROP TABLE daily_activity")
+        conn.execute("PRAGMA user_version = 11")
+        conn.commit()
+        conn.close()
+        init_db(db)
+        assert self._rollups(db) == incremental
+        assert sum(row["stored"] for row in get_trends(db)) == 17
+
+    def test_cli(self, tmp_path, monkeypatch, capsys):
+        db = str(tmp_path / "test.db")
+        init_db(db)
+        _seed_posts(db, count=3)
+        monkeypatch.setenv("LINKEDIN_DB_PATH", db)
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "trends", "--days", "7"])
+        main()
+        assert json.loads(capsys.readouterr().out)[-1]["backlog"] == 3
+        monkeypatch.setattr(sys, "argv", ["linkedin_feed.py", "rebuild-trends"])
+        main()
+        assert "Counted 3" in capsys.readouterr().out